@@ -3,10 +3,15 @@ The main Cellular Automaton to model the ants behaviour.
 """
 
 from Neighborhood import VonNeumannNeighborhood
+from TimeSeries import TimeSeries
+
+import Snapshot
 
 from enum import IntEnum
-from random import random, randint, choice, randrange
 from copy import deepcopy
+import warnings
+
+import numpy as np
 
 
 class Cell(IntEnum):
@@ -21,23 +26,99 @@ class Cell(IntEnum):
     EMPTY = 8
 
 
+# A value counted every time step, which is the sum of a value for every cell.
+# AntsCA keeps the sum up to date as cells are written, so a metric does not
+# need a pass over the grid. In lazy mode the pheromones of empty cells are only
+# up to date where an ant has read them, so metrics should not depend on those.
+class CellMetric():
+    # Value of a single cell.
+    def cell(self, state, pher, signal):
+        return 0
+
+
+# Number of ants carrying food.
+class AntsCarryingFood(CellMetric):
+    def cell(self, state, pher, signal):
+        return 1 if state >= Cell.NORTH and state <= Cell.STAY and signal > 0 else 0
+
+
+# One of values, picked uniformly like random.choice with a random number u in [0, 1).
+def pick(values, u):
+    return values[int(u * len(values))]
+
+
+# Random places for the food sources and ants of a new N x N grid with the nest at
+# flat index nest. The cells are drawn at once without replacement from the empty
+# cells, so a full grid takes as long as an empty one. Returns the flat indices of
+# the food and the ants, and the direction of every ant.
+def place_randomly(rng, N, nest, food_sources, ants_count):
+    inside = np.arange(N * N).reshape(N, N)[1:-1, 1:-1].reshape(-1)
+    free = inside[inside != nest]
+    if food_sources + ants_count > len(free):
+        raise ValueError("A grid of " + str(N) + "x" + str(N) + " has room for " + str(len(free)) +
+                         " food sources and ants.")
+
+    cells = rng.choice(free, size=food_sources + ants_count, replace=False)
+    directions = rng.integers(Cell.NORTH, Cell.WEST + 1, size=ants_count)
+    return (cells[:food_sources], cells[food_sources:], directions)
+
+
+# The number of ants, the number of food sources and the food per source of a grid
+# made beforehand, such as a scenario.
+def grid_counts(state, signal):
+    food = np.asarray(state) == Cell.FOOD
+    ants = (np.asarray(state) >= Cell.NORTH) & (np.asarray(state) <= Cell.STAY)
+    amount = int(np.asarray(signal)[food].max()) if food.any() else 0
+    return (int(np.count_nonzero(ants)), int(np.count_nonzero(food)), amount)
+
+
 class AntsCA():
     # Configuration variables
     BORDER_PHER = -1.
     FOOD_PHER = -2
     PHER_EVAPORATE = .005
     INIT_ANT_SIGNAL = 100
-    __neighborhood = VonNeumannNeighborhood()
 
-    def __init__(self, food_sources=10, food_amount=10, N=50, ants_count=100, preset=None):
+    # With jit=True a JitAntsCA is made instead, which runs the same rules compiled
+    # to native code. The Python engine is kept if numba is not installed, and for
+    # metrics, which JitAntsCA does not count, and for a radius above 1.
+    def __new__(cls, *args, jit=False, **kwargs):
+        if jit and cls is AntsCA and not kwargs.get("metrics") and kwargs.get("radius", 1) == 1:
+            import JitAntsCA
+            if JitAntsCA.njit:
+                return super().__new__(JitAntsCA.JitAntsCA)
+            warnings.warn("numba is not installed, running the Python engine instead.")
+        return super().__new__(cls)
+
+
+    def __init__(self, food_sources=10, food_amount=10, N=50, ants_count=100, preset=None, sparse=False, lazy=False, seed=None, metrics=(), counter=None, snapshot=None, scenario=None, radius=1, jit=False, config=None):
+        self.configure(config)
         self.FOOD_IN_NEST = 0
         self.NEST_COORD = (0,0)
-        self.counter = [[0,0]]
         self.ants_count = ants_count
         self.INIT_N_FOOD = food_sources
         self.INIT_FOOD_PER_SPOT = food_amount
-
-        if preset:
+        self.sparse = sparse
+        self.lazy = lazy
+        self.ticks = 0
+        self.moved = 0
+        self.stalled = 0
+        self.picked_up = 0
+        self.stop_reason = None
+
+        # Every CA draws from its own generator. seed can be a number or a
+        # np.random.SeedSequence, and the same seed gives the same run as
+        # NumpyAntsCA and JitAntsCA.
+        self.rng = np.random.default_rng(seed)
+
+        # A snapshot continues the run it was saved from, see Snapshot.py.
+        # A scenario is a grid made beforehand, see Scenario.py.
+        if snapshot:
+            info = self.__load_snapshot(snapshot)
+        elif scenario is not None:
+            self.__load_arrays(*scenario)
+            (self.ants_count, self.INIT_N_FOOD, self.INIT_FOOD_PER_SPOT) = grid_counts(scenario[0], scenario[2])
+        elif preset:
             self.load_file(preset)
         else:
             # If no preset is given, initialize the grid randomly.
@@ -45,6 +126,70 @@ class AntsCA():
             self.grid = [[self.__init_cell((x, y)) for x in range(0, N)] for y in range(0, N)]
             self.__populate_grid()
 
+        # Second grid buffer that the next time step is written to.
+        # Only the cells written in a phase are copied back before the next one.
+        # The cells of both grids are also kept in flat lists, indexed by y * N + x.
+        self.__back = deepcopy(self.grid)
+        self.__cells = [cell for row in self.grid for cell in row]
+        self.__back_cells = [cell for row in self.__back for cell in row]
+        self.__dirty = []
+
+        # An ant senses the cells within radius steps, which are looked up in a table.
+        self.__neighbors = VonNeumannNeighborhood(radius).table(self.N)
+
+        # In sparse mode the rules are only applied to the ants, which are indexed
+        # by (y, x) so sorting them gives the scan order. Pheromones only evaporate
+        # on the trail, the cells that were left with pheromones.
+        if self.sparse:
+            self.__ants = {}
+            self.__trail = set()
+            for (x, y) in self.__internal_cells():
+                [state, pher, _] = self.grid[y][x]
+                if state >= Cell.NORTH and state <= Cell.STAY:
+                    self.__ants[(y, x)] = state
+                elif state == Cell.EMPTY and pher > 0:
+                    self.__trail.add((x, y))
+
+        # In lazy mode the pheromones on an empty cell are the value at the time step
+        # in __stamp, and only evaporate when they are read.
+        if self.lazy:
+            self.__stamp = [[self.ticks] * self.N for _ in range(self.N)]
+
+        # The food in the nest and the number of ants on pheromones are counted
+        # when cells are written, as are the sums of the extra metrics.
+        # These are added to the counter after the food and ants on pheromones.
+        # The counter is a TimeSeries, counter holds its options, e.g. dict(window=1000).
+        self.metrics = list(metrics)
+        self.__on_pher = 0
+        self.__totals = [0] * len(self.metrics)
+        self.FOOD_TOTAL = 0
+        self.__ant_count = 0
+        for (x, y) in self.__internal_cells():
+            [state, pher, signal] = self.grid[y][x]
+            self.__on_pher += self.__on_pher_cell(state, pher)
+            if state >= Cell.NORTH and state <= Cell.STAY:
+                self.__ant_count += 1
+            if state == Cell.FOOD:
+                self.FOOD_TOTAL += signal
+            for (i, metric) in enumerate(self.metrics):
+                self.__totals[i] += metric.cell(state, pher, signal)
+        self.counter = TimeSeries(2 + len(self.metrics), dtype=float if self.metrics else int, **(counter or {}))
+        if snapshot:
+            Snapshot.restore(self, snapshot, info, seed)
+            # The configuration given wins over the one of the snapshot.
+            self.configure(config)
+        else:
+            self.counter.append([0,0] + self.__totals)
+
+
+    # Set configuration variables, such as PHER_EVAPORATE, for this CA only.
+    # They are given to the constructor as config, so they are set before the grid is made.
+    def configure(self, config):
+        for (name, value) in (config or {}).items():
+            if not (name.isupper() and hasattr(AntsCA, name)):
+                raise ValueError("Unknown configuration variable: " + name)
+            setattr(self, name, value)
+
 
     # Load a file containing a preset grid for debugging and reproducability.
     # Note that the grid must be NxN.
@@ -54,6 +199,7 @@ class AntsCA():
             filecontents = f.readlines()
 
         self.grid = []
+        ants = []
         for y, line in enumerate(filecontents):
             self.grid.append([])
             if not self.N:
@@ -68,13 +214,49 @@ class AntsCA():
                     self.NEST_COORD = (x, y)
                     cell = [Cell.NEST, -2, 0]
                 elif char == "A":
-                    cell = [Cell(randint(Cell.NORTH, Cell.WEST)), 0., 0]
+                    cell = [Cell.NORTH, 0., 0]
+                    ants.append(cell)
                 elif char == "F":
                     cell = [Cell.FOOD, self.FOOD_PHER, self.INIT_FOOD_PER_SPOT]
                 elif char == "\n":
                     continue
                 self.grid[y].append(cell)
 
+        self.__turn_randomly(ants)
+
+
+    # Turn the ants, cells of the grid, in random directions, drawn all at once.
+    def __turn_randomly(self, ants):
+        cells = list(Cell)
+        for (cell, direction) in zip(ants, self.rng.integers(Cell.NORTH, Cell.WEST + 1, size=len(ants)).tolist()):
+            cell[0] = cells[direction]
+
+
+    # Load the grid of a snapshot and return its other values.
+    def __load_snapshot(self, path):
+        (arrays, info) = Snapshot.load(path)
+        if info["cells"] != "exact":
+            raise ValueError("Snapshots with cells=\"" + info["cells"] + "\" can only be loaded by NumpyAntsCA.")
+
+        self.__load_arrays(*arrays)
+        self.ticks = info["ticks"]
+        return info
+
+
+    # Make the grid from the arrays of the exact layout of NumpyAntsCA.
+    def __load_arrays(self, state, pher, signal):
+        self.N = len(state)
+        (y, x) = np.argwhere(state == Cell.NEST)[0].tolist()
+        self.NEST_COORD = (x, y)
+        cells = list(Cell)
+        self.grid = [[[cells[s], p, g] for (s, p, g) in zip(*row)]
+                     for row in zip(state.tolist(), pher.tolist(), signal.tolist())]
+
+
+    # Save the complete state of the CA, to continue it later, see Snapshot.py.
+    def save_snapshot(self, path):
+        Snapshot.save(self, path)
+
 
     # Initialize each cell in grid the grid to become border or empty.
     def __init_cell(self, coords):
@@ -91,25 +273,16 @@ class AntsCA():
         self.grid[y][x] = [Cell.NEST, -2, 0]
         self.NEST_COORD = (x,y)
 
-        # Randomly place food cells.
-        n_food = 0
-        while n_food < self.INIT_N_FOOD:
-            x = randrange(1, self.N - 1)
-            y = randrange(1, self.N - 1)
+        # Randomly place food cells and ants.
+        (food, ants, directions) = place_randomly(self.rng, self.N, y * self.N + x, self.INIT_N_FOOD, self.ants_count)
+        for i in food.tolist():
+            (y, x) = divmod(i, self.N)
+            self.grid[y][x] = [Cell.FOOD, self.FOOD_PHER, self.INIT_FOOD_PER_SPOT]
 
-            if self.grid[y][x][0] == Cell.EMPTY:
-                self.grid[y][x] = [Cell.FOOD, self.FOOD_PHER, self.INIT_FOOD_PER_SPOT]
-                n_food += 1
-
-        n_ants = 0
-        while n_ants < self.ants_count:
-            x = randrange(1, self.N - 1)
-            y = randrange(1, self.N - 1)
-
-            if self.grid[y][x][0] == Cell.EMPTY:
-                cell = Cell(randint(Cell.NORTH, Cell.WEST))
-                self.grid[y][x] = [cell, 0., 0]
-                n_ants += 1
+        cells = list(Cell)
+        for (i, direction) in zip(ants.tolist(), directions.tolist()):
+            (y, x) = divmod(i, self.N)
+            self.grid[y][x] = [cells[direction], 0., 0]
 
 
     # Print grid in text.
@@ -152,6 +325,15 @@ class AntsCA():
                 yield (x, y)
 
 
+    # Get coordinates of the cells the rules are applied to, in scan order.
+    # In sparse mode these are only the cells holding an ant.
+    def __active_cells(self):
+        if not self.sparse:
+            return self.__internal_cells()
+
+        return [(x, y) for (y, x) in sorted(self.__ants)]
+
+
     # Advance the CA one time step.
     def evolve(self):
         self.__sense()
@@ -159,37 +341,171 @@ class AntsCA():
         self.__count()
 
 
+    # Advance the CA until a stop condition is met, and return why it stopped:
+    # "food" once the fraction target of all food is in the nest,
+    # "max_ticks" after max_ticks time steps of this call, so a run can be continued for more,
+    # "stalled" when no ant moved and no food was brought to the nest for stall_ticks time steps,
+    # "repeated" when detect_repeats is set and the grid is the same as at an earlier time step.
+    # The reason is also kept in stop_reason.
+    def run(self, max_ticks=None, stall_ticks=None, target=1., detect_repeats=False):
+        self.stop_reason = None
+        start = self.ticks
+        idle = 0
+        seen = set()
+
+        while True:
+            food = self.FOOD_IN_NEST
+            self.evolve()
+
+            if self.moved == 0 and self.FOOD_IN_NEST == food:
+                idle += 1
+            else:
+                idle = 0
+
+            if self.FOOD_IN_NEST >= target * self.FOOD_TOTAL:
+                self.stop_reason = "food"
+            elif max_ticks is not None and self.ticks - start >= max_ticks:
+                self.stop_reason = "max_ticks"
+            elif stall_ticks is not None and idle >= stall_ticks:
+                self.stop_reason = "stalled"
+            elif detect_repeats:
+                state = self.state_hash()
+                if state in seen:
+                    self.stop_reason = "repeated"
+                seen.add(state)
+
+            if self.stop_reason:
+                # A streamed counter has all rows of the run on disk once it stops.
+                self.counter.flush()
+                return self.stop_reason
+
+
+    # Hash of the complete grid, to recognise a grid seen before.
+    def state_hash(self):
+        self.sync_pheromones()
+        return hash(tuple(tuple(cell) for row in self.grid for cell in row))
+
+
+    # Get the buffer to write the next grid to.
+    # It is brought up to date with the current grid by copying the cells
+    # written in the last phase, so it matches a full copy of the grid.
+    def __next_grid(self):
+        for (x, y) in self.__dirty:
+            self.__back[y][x][:] = self.grid[y][x]
+        self.__dirty = []
+
+        return self.__back
+
+
+    # Make the buffer that was written to the current grid.
+    def __swap(self, grid_copy):
+        self.__back = self.grid
+        self.grid = grid_copy
+        (self.__cells, self.__back_cells) = (self.__back_cells, self.__cells)
+
+
+    # Whether a cell holds an ant on pheromones.
+    def __on_pher_cell(self, state, pher):
+        return state >= Cell.NORTH and state <= Cell.STAY and pher > 0
+
+
+    # Write a cell in the buffer for the next grid, and update the counts
+    # with the difference to what the cell held before.
+    def __write(self, grid_copy, x, y, state, pher, signal):
+        cell = grid_copy[y][x]
+        [ostate, opher, osignal] = cell
+        if state <= Cell.STAY or ostate <= Cell.STAY:
+            self.__on_pher += self.__on_pher_cell(state, pher) - self.__on_pher_cell(ostate, opher)
+
+        if self.metrics:
+            for (i, metric) in enumerate(self.metrics):
+                self.__totals[i] += metric.cell(state, pher, signal) - metric.cell(ostate, opher, osignal)
+
+        cell[0] = state
+        cell[1] = pher
+        cell[2] = signal
+        self.__dirty.append((x, y))
+
+        if self.sparse:
+            if state >= Cell.NORTH and state <= Cell.STAY:
+                self.__ants[(y, x)] = state
+            else:
+                self.__ants.pop((y, x), None)
+                if state == Cell.EMPTY and pher > 0 and not self.lazy:
+                    self.__trail.add((x, y))
+
+
+    # Pheromones left on an empty cell after a number of time steps.
+    # The evaporation is repeated step by step to give the same value as
+    # evaporating every time step.
+    def __decay(self, pher, steps):
+        while steps > 0 and pher > 0:
+            pher = self.__evaporate(pher)
+            steps -= 1
+
+        return pher
+
+
+    # Get the current pheromones on the cell at x, y.
+    def pheromone(self, x, y):
+        [state, pher, _] = self.grid[y][x]
+        if self.lazy and state == Cell.EMPTY:
+            return self.__decay(pher, self.ticks - self.__stamp[y][x])
+
+        return pher
+
+
+    # Bring the pheromones in the grid up to date in lazy mode,
+    # for code that reads them from the grid directly.
+    def sync_pheromones(self):
+        if not self.lazy:
+            return
+
+        for (x, y) in self.__internal_cells():
+            if self.grid[y][x][0] == Cell.EMPTY:
+                self.grid[y][x][1] = self.pheromone(x, y)
+                self.__stamp[y][x] = self.ticks
+                self.__dirty.append((x, y))
+
+
     # Execute the "sense" algorithm from the book on the grid,
     # which rotates each ant towards the cell it wants to move to.
     def __sense(self):
-        grid_copy = deepcopy(self.grid)
+        grid_copy = self.__next_grid()
+        self.picked_up = 0
 
-        for (x, y) in self.__internal_cells():
-            neighbors = self.__neighborhood.for_coords(x, y, self.N)
-            self.__sense_cell(x, y, neighbors, grid_copy)
+        # Two random numbers for every ant in scan order, drawn all at once: one to
+        # choose between the best neighbors and one between the directions.
+        self.__draws = iter(self.rng.random((2, self.__ant_count)).T.tolist())
 
-        self.grid = grid_copy
+        for (x, y) in self.__active_cells():
+            self.__sense_cell(x, y, grid_copy)
+
+        self.__swap(grid_copy)
 
 
     # Execute the "sense" algorithm from the book for each cell.
-    def __sense_cell(self, x, y, neighbors, grid_copy):
+    def __sense_cell(self, x, y, grid_copy):
         [site, pher, signal] = self.grid[y][x]
 
         # Skip if the cell does not contain an ant.
         if site < Cell.NORTH or site > Cell.STAY:
             return
+        (u_best, u_direction) = next(self.__draws)
 
         # At this time he ant faces the way it just came from,
         # but can also be STAY if it did not move the last time step.
+        # Cells are given by their flat index from here on.
+        i = y * self.N + x
         prev = None
         if site == Cell.NORTH:
-            prev = (x, y-1)
+            prev = i - self.N
         elif site == Cell.SOUTH:
-            prev = (x, y+1)
+            prev = i + self.N
         elif site == Cell.WEST:
-            prev = (x-1, y)
+            prev = i - 1
         elif site == Cell.EAST:
-            prev = (x+1, y)
+            prev = i + 1
 
         # Determine which directions the ant can turn to.
         directions = []
@@ -200,7 +516,9 @@ class AntsCA():
         if signal > 0:
             if (abs(cx-x) == 0 or abs(cy-y) == 0) and (abs(cx+cy-x-y) == 1):
                 # Increment the signal in the nest, indicating food collected.
-                grid_copy[cy][cx][2] += 1
+                [nest, npher, nsig] = grid_copy[cy][cx]
+                self.__write(grid_copy, cx, cy, nest, npher, nsig + 1)
+                self.FOOD_IN_NEST += 1
                 if cx > x and self.grid[y][x-1][0] == Cell.EMPTY:
                     directions.append(Cell.WEST)
                 elif cx < x and self.grid[y][x-1][0] == Cell.EMPTY:
@@ -217,31 +535,38 @@ class AntsCA():
         # If the ant is searching for food, it turns to cells with the highest pheromones.
         # If the ant has food but cannot move towards the nest this time step, also do this.
         if signal == 0 or directions == []:
-            (best, signal) = self.__find_best_neighbor(neighbors, prev, signal, grid_copy)
-            if not best:
+            (best, signal) = self.__find_best_neighbor(i, prev, signal, grid_copy, u_best)
+            if best is None:
                 # Could not find a cell to move to, stay in place.
-                grid_copy[y][x] = [Cell.STAY, pher, signal]
+                self.__write(grid_copy, x, y, Cell.STAY, pher, signal)
                 return
 
-            (nx, ny) = best
+            (ny, nx) = divmod(best, self.N)
             self.__return_direction(nx, ny, x, y, directions)
 
-        direction = choice(directions)
-        grid_copy[y][x] = [direction, pher, signal]
+            # With a radius above 1 the cells towards the best one can be taken.
+            if directions == []:
+                self.__write(grid_copy, x, y, Cell.STAY, pher, signal)
+                return
+
+        direction = pick(directions, u_direction)
+        self.__write(grid_copy, x, y, direction, pher, signal)
 
 
     # Find the neighbor cell with the heighest pheromones to move to.
     # Also update the signal in case the ant is next to the nest.
-    def __find_best_neighbor(self, neighbors, prev, signal, grid_copy):
+    # Ties are broken with the random number u.
+    def __find_best_neighbor(self, i, prev, signal, grid_copy, u):
         max_pher = float('-inf')
         max_cells = []
+        cells = self.__cells
 
         # Find the cell(s) in the neighborhood with the highest pheromones.
-        for (nx, ny) in neighbors:
-            [state, npher, nsig] = self.grid[ny][nx]
+        for n in self.__neighbors.of(i):
+            [state, npher, nsig] = cells[n]
             pher_result = 0.
 
-            if prev == (nx, ny):
+            if prev == n:
                 # Do not turn to the cell we just came from.
                 pher_result = -2.
             elif state >= Cell.NORTH and state <= Cell.STAY:
@@ -250,43 +575,56 @@ class AntsCA():
             elif state == Cell.FOOD:
                 # If neighbor is food we set the signal to imply an ant with food.
                 pher_result = -2.
-                if signal == 0:
-                    # Take food if ant does not have food already.
+                # Take food if ant does not have food already, only from
+                # the four cells next to it when it senses further.
+                if signal == 0 and (n - i in (1, -1) or n - i in (self.N, -self.N)):
+                    (ny, nx) = divmod(n, self.N)
                     if (nsig - 1) > 0:
-                        self.grid[ny][nx][2] -= 1
-                        grid_copy[ny][nx] = [state, npher, nsig - 1]
+                        cells[n][2] -= 1
+                        self.__write(grid_copy, nx, ny, state, npher, nsig - 1)
                     else:
-                        grid_copy[ny][nx] = [Cell.EMPTY, 0, 0]
+                        self.__write(grid_copy, nx, ny, Cell.EMPTY, 0, 0)
+                        if self.lazy:
+                            self.__stamp[ny][nx] = self.ticks
                     signal = self.INIT_ANT_SIGNAL
+                    self.picked_up += 1
+            elif self.lazy and state == Cell.EMPTY:
+                # Store the evaporated pheromones in both grids, so they
+                # do not have to be evaporated again.
+                (ny, nx) = divmod(n, self.N)
+                pher_result = self.pheromone(nx, ny)
+                cells[n][1] = grid_copy[ny][nx][1] = pher_result
+                self.__stamp[ny][nx] = self.ticks
             else:
                 pher_result = npher
 
             if pher_result > max_pher:
                 # We have seen a cell with higher pheromones.
                 max_pher = pher_result
-                max_cells = [(nx, ny)]
+                max_cells = [n]
             elif pher_result == max_pher:
                 # We have seen a cell with equal pheromones.
-                max_cells.append((nx, ny))
+                max_cells.append(n)
 
         if max_pher < 0.:
             # Can't see a cell with positive pheromones, stay in place.
             return (None, signal)
 
         # We have found a cell, now check how we should turn.
-        return (choice(max_cells), signal)
+        return (pick(max_cells, u), signal)
 
 
     # Update the directions list with directions the ant can go to
-    # in order to reach the given goal.
+    # in order to reach the given goal. prev is the flat index of a cell to avoid.
     def __return_direction(self, nx, ny, x, y, directions, prev=None):
-        if nx > x and self.grid[y][x+1][0] == Cell.EMPTY and (x+1, y) != prev:
+        i = y * self.N + x
+        if nx > x and self.grid[y][x+1][0] == Cell.EMPTY and i + 1 != prev:
             directions.append(Cell.EAST)
-        elif nx < x and self.grid[y][x-1][0] == Cell.EMPTY and (x-1, y) != prev:
+        elif nx < x and self.grid[y][x-1][0] == Cell.EMPTY and i - 1 != prev:
             directions.append(Cell.WEST)
-        if ny > y and self.grid[y+1][x][0] == Cell.EMPTY and (x, y+1) != prev:
+        if ny > y and self.grid[y+1][x][0] == Cell.EMPTY and i + self.N != prev:
             directions.append(Cell.SOUTH)
-        elif ny < y and self.grid[y-1][x][0] == Cell.EMPTY and (x, y-1) != prev:
+        elif ny < y and self.grid[y-1][x][0] == Cell.EMPTY and i - self.N != prev:
             directions.append(Cell.NORTH)
 
 
@@ -294,12 +632,36 @@ class AntsCA():
     # This moves the ants towards the cell they turned to, if possible.
     # Also update the pheromones for each cell.
     def __walk(self):
-        grid_copy = deepcopy(self.grid)
+        grid_copy = self.__next_grid()
+        self.moved = 0
+        self.stalled = 0
 
-        for (x, y) in self.__internal_cells():
+        if self.sparse and not self.lazy:
+            self.__evaporate_trail(grid_copy)
+
+        for (x, y) in self.__active_cells():
             self.__walk_cell(x, y, grid_copy)
 
-        self.grid = grid_copy
+        self.__swap(grid_copy)
+        self.ticks += 1
+
+
+    # Evaporate the pheromones on the trail before the ants walk in sparse mode.
+    # Cells that are no longer empty or have no pheromones left leave the trail.
+    def __evaporate_trail(self, grid_copy):
+        for (x, y) in list(self.__trail):
+            [state, pher, _] = self.grid[y][x]
+            if state == Cell.EMPTY and pher > 0:
+                pher = self.__evaporate(pher)
+                self.__write(grid_copy, x, y, Cell.EMPTY, pher, 0)
+
+            if state != Cell.EMPTY or pher <= 0:
+                self.__trail.discard((x, y))
+
+
+    # Pheromones left on an empty cell after one time step.
+    def __evaporate(self, pher):
+        return max(0., pher - self.PHER_EVAPORATE)
 
 
     # Execute the "walk" algorithm from the book for each cell.
@@ -310,10 +672,13 @@ class AntsCA():
             return
 
         if state == Cell.EMPTY:
+            if self.lazy:
+                return
+
             # If the cell is empty, update its pheromones.
-            if grid_copy[y][x][0] == Cell.EMPTY:
-                [dstate, _, _] = grid_copy[y][x]
-                grid_copy[y][x] = [dstate, max(0., pher- self.PHER_EVAPORATE), 0]
+            # Cells without pheromones stay the same, so they are not written.
+            if grid_copy[y][x][0] == Cell.EMPTY and pher > 0:
+                self.__write(grid_copy, x, y, Cell.EMPTY, self.__evaporate(pher), 0)
             return
 
         # For each possible direction, attempt to move the ant there.
@@ -349,26 +714,30 @@ class AntsCA():
                 direction = Cell.EAST
                 moved = True
 
+        if moved and self.lazy:
+            # Pheromones on empty cells evaporate when the walk passes them in scan order.
+            # A cell the ant left this time step has a stamp of the next time step.
+            now = self.ticks + 1 if (dy, dx) < (y, x) else self.ticks
+            dpher = self.__decay(dpher, now - self.__stamp[dy][dx])
+        elif moved and self.sparse and (dy, dx) > (y, x) and self.grid[dy][dx][0] == Cell.EMPTY:
+            # The trail has already evaporated, but in scan order this cell
+            # would only evaporate after the ant has moved there.
+            dpher = self.grid[dy][dx][1]
+
         if moved:
             move_pher = dpher if signal <= 0 else signal / self.INIT_ANT_SIGNAL
             signal = signal if signal <= 1 else signal-1
 
-            grid_copy[y][x] = [Cell.EMPTY, move_pher, 0]
-            grid_copy[dy][dx] = [direction, dpher, signal]
+            self.__write(grid_copy, x, y, Cell.EMPTY, move_pher, 0)
+            self.__write(grid_copy, dx, dy, direction, dpher, signal)
+            self.moved += 1
+            if self.lazy:
+                self.__stamp[y][x] = self.ticks + 1
         else:
-            grid_copy[y][x] = [Cell.STAY, pher, signal]
+            self.__write(grid_copy, x, y, Cell.STAY, pher, signal)
+            self.stalled += 1
 
 
     # Count variables of AntsCA for graphs.
     def __count(self):
-
-        (cx, cy) = self.NEST_COORD
-        food = self.grid[cy][cx][2]
-
-        on_pher = 0
-        for (x, y) in self.__internal_cells():
-            [site, pher, _] = self.grid[y][x]
-            if site >= Cell.NORTH and site <= Cell.STAY and pher > 0:
-                on_pher += 1
-
-        self.counter.append([food, on_pher])
\ No newline at end of file
+        self.counter.append([self.FOOD_IN_NEST, self.__on_pher] + self.__totals)
@@ -0,0 +1,258 @@
+"""
+Engine for the ants Cellular Automaton that compiles the per-cell loops of
+AntsCA to native code with numba. The cells are kept in the arrays of
+NumpyAntsCA and visited one by one in the scan order of AntsCA, so ants
+claim empty cells and take food first come, first served, as in AntsCA.
+numba is optional: AntsCA(jit=True) uses the Python engine when it is not
+installed, and JitAntsCA itself then runs the same loops as Python code.
+"""
+
+import numpy as np
+
+from AntsCA import Cell
+from NumpyAntsCA import NumpyAntsCA, evaporation, find_ants
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+NORTH = int(Cell.NORTH)
+EAST = int(Cell.EAST)
+SOUTH = int(Cell.SOUTH)
+WEST = int(Cell.WEST)
+STAY = int(Cell.STAY)
+FOOD = int(Cell.FOOD)
+NEST = int(Cell.NEST)
+EMPTY = int(Cell.EMPTY)
+
+
+# Flat index of the cell an ant in state s faces, i itself if it stays.
+def facing(i, s, N):
+    if s == NORTH:
+        return i - N
+    if s == EAST:
+        return i + 1
+    if s == SOUTH:
+        return i + N
+    if s == WEST:
+        return i - 1
+    return i
+
+
+# The "sense" rule of AntsCA.__sense_cell for every ant in scan order, with the
+# flat arrays updated in place. The ants read the food and nest as they were at
+# the start of the time step: the signal of a food cell is counted down at once,
+# but the cell is only emptied after all ants have sensed.
+# u0 and u1 hold a random number for every ant, to break ties between the best
+# neighbors and between the directions, as in NumpyAntsCA.sense.
+# Returns the number of ants that picked up food.
+def sense_cells(state, pher, signal, N, nest, u0, u1, init_signal):
+    nest_x = nest % N
+    nest_y = nest // N
+    picked = 0
+    j = 0
+    candidates = np.zeros(4, dtype=np.int64)
+
+    for i in range(N, N * (N - 1)):
+        s = state[i]
+        if s < NORTH or s > STAY:
+            continue
+
+        x = i % N
+        y = i // N
+        g = signal[i]
+        prev = facing(i, s, N)
+        dx = nest_x - x
+        dy = nest_y - y
+        first = 0
+        second = 0
+        best_needed = True
+
+        if g > 0 and abs(dx) + abs(dy) == 1:
+            # Drop the food in the nest and turn around.
+            signal[nest] += 1
+            g = 0
+            if dx > 0 and state[i - 1] == EMPTY:
+                first = WEST
+            elif dx < 0 and state[i - 1] == EMPTY:
+                first = EAST
+            elif dy > 0 and state[i + N] == EMPTY:
+                first = NORTH
+            elif dy < 0 and state[i - N] == EMPTY:
+                first = SOUTH
+        elif g > 0:
+            # Turn towards the nest.
+            if dx > 0 and state[i + 1] == EMPTY and i + 1 != prev:
+                first = EAST
+            elif dx < 0 and state[i - 1] == EMPTY and i - 1 != prev:
+                first = WEST
+            if dy > 0 and state[i + N] == EMPTY and i + N != prev:
+                second = SOUTH
+            elif dy < 0 and state[i - N] == EMPTY and i - N != prev:
+                second = NORTH
+            best_needed = first == 0 and second == 0
+
+        if best_needed:
+            # The neighbors in the order of VonNeumannNeighborhood: west, east, south, north.
+            best = -np.inf
+            count = 0
+            for k in range(4):
+                if k == 0:
+                    (n, nx, ny, direction) = (i - 1, x - 1, y, WEST)
+                elif k == 1:
+                    (n, nx, ny, direction) = (i + 1, x + 1, y, EAST)
+                elif k == 2:
+                    (n, nx, ny, direction) = (i + N, x, y + 1, SOUTH)
+                else:
+                    (n, nx, ny, direction) = (i - N, x, y - 1, NORTH)
+                if nx <= 0 or ny <= 0 or nx >= N - 1 or ny >= N - 1:
+                    continue
+
+                ns = state[n]
+                if n == prev or (ns >= NORTH and ns <= STAY) or ns == NEST:
+                    score = -2.
+                elif ns == FOOD:
+                    score = -2.
+                    if g == 0:
+                        signal[n] -= 1
+                        picked += 1
+                        g = init_signal
+                else:
+                    score = float(pher[n])
+
+                if score > best:
+                    best = score
+                    count = 0
+                if score == best:
+                    candidates[count] = direction
+                    count += 1
+
+            if best < 0.:
+                state[i] = STAY
+                signal[i] = g
+                j += 1
+                continue
+            second = candidates[int(u0[j] * count)]
+
+        # Pick one of the directions found, like random.choice.
+        if first != 0 and second != 0:
+            state[i] = first if int(u1[j] * 2) == 0 else second
+        else:
+            state[i] = first + second
+        signal[i] = g
+        j += 1
+
+    # Food cells that ran out are emptied.
+    for i in range(N, N * (N - 1)):
+        if state[i] == FOOD and signal[i] <= 0:
+            state[i] = EMPTY
+            pher[i] = 0
+            signal[i] = 0
+
+    return picked
+
+
+# The "walk" rule of AntsCA.__walk_cell for every cell in scan order, with the
+# flat arrays updated in place. old holds the states after the sense rule,
+# so an ant that walks into a cell later in scan order does not walk again.
+# The pheromones are stored multiplied by scale, see CELLS, and evaporate is
+# given in the same units and dtype, so it is subtracted as in NumpyAntsCA.walk.
+# Returns the number of ants that moved and the number of ants on pheromones.
+def walk_cells(state, pher, signal, old, N, evaporate, init_signal, scale):
+    moved = 0
+    on_pher = 0
+
+    for i in range(N, N * (N - 1)):
+        s = old[i]
+        if s == EMPTY:
+            if state[i] == EMPTY and pher[i] > 0:
+                pher[i] = pher[i] - evaporate if pher[i] > evaporate else 0
+                signal[i] = 0
+            continue
+        if s < NORTH or s > STAY:
+            continue
+
+        target = facing(i, s, N)
+        if s == STAY or state[target] != EMPTY:
+            state[i] = STAY
+            if pher[i] > 0:
+                on_pher += 1
+            continue
+
+        g = signal[i]
+        dpher = pher[target]
+        if g <= 0:
+            pher[i] = dpher
+        elif scale == 1.:
+            pher[i] = g / init_signal
+        else:
+            pher[i] = np.rint(g * scale / init_signal)
+        state[i] = EMPTY
+        signal[i] = 0
+
+        if s == NORTH:
+            state[target] = SOUTH
+        elif s == EAST:
+            state[target] = WEST
+        elif s == SOUTH:
+            state[target] = NORTH
+        else:
+            state[target] = EAST
+        pher[target] = dpher
+        signal[target] = g - 1 if g > 1 else g
+        moved += 1
+        if dpher > 0:
+            on_pher += 1
+
+    return (moved, on_pher)
+
+
+if njit:
+    facing = njit(cache=True)(facing)
+    sense_cells = njit(cache=True)(sense_cells)
+    walk_cells = njit(cache=True)(walk_cells)
+
+
+class JitAntsCA(NumpyAntsCA):
+    # The options of AntsCA that do not change the results, such as sparse
+    # and lazy, are accepted so AntsCA(jit=True) can pass them on.
+    def __init__(self, food_sources=10, food_amount=10, N=50, ants_count=100, preset=None, seed=None, counter=None,
+                 cells="exact", snapshot=None, scenario=None, config=None, **options):
+        super().__init__(food_sources, food_amount, N, ants_count, preset, seed, counter, cells, snapshot, scenario,
+                         config)
+        self.ants = len(find_ants(self.state.reshape(-1)))
+
+
+    # Flat index of the nest.
+    def __nest_index(self):
+        (x, y) = self.NEST_COORD
+        return y * self.N + x
+
+
+    # Advance the CA one time step.
+    def evolve(self):
+        self.__sense()
+        self.__walk()
+        self.__count()
+        self.ticks += 1
+
+
+    def __sense(self):
+        (u0, u1) = self.rng.random((2, self.ants))
+        self.picked_up = sense_cells(self.state.reshape(-1), self.pher.reshape(-1), self.signal.reshape(-1),
+                                     self.N, self.__nest_index(), u0, u1, self.INIT_ANT_SIGNAL)
+
+
+    def __walk(self):
+        (self.moved, self.__on_pher) = walk_cells(
+            self.state.reshape(-1), self.pher.reshape(-1), self.signal.reshape(-1), self.state.reshape(-1).copy(),
+            self.N, self.pher.dtype.type(evaporation(self.PHER_EVAPORATE, self.pher_scale)), self.INIT_ANT_SIGNAL,
+            self.pher_scale)
+        self.stalled = self.ants - self.moved
+
+
+    def __count(self):
+        self.FOOD_IN_NEST = int(self.signal.reshape(-1)[self.__nest_index()])
+        self.counter.append([self.FOOD_IN_NEST, self.__on_pher])
@@ -1,11 +1,16 @@
 """
 Class to create the Von Neumann neighorhoods.
-We originally planned to use bigger neighborhoods, but this is unused.
+The neighbors of every cell can be looked up in a table that is computed
+once per grid size, which keeps bigger neighborhoods cheap.
 """
 
+import numpy as np
+
+
 class VonNeumannNeighborhood():
 
     def __init__(self, r=1):
+        self.r = r
         self.coords = [(x, 0) for x in range(-r, r+1) if x != 0]
 
         # Top and bottom triangle
@@ -25,4 +30,40 @@ class VonNeumannNeighborhood():
             if resx > 0 and resy > 0 and resx < N-1 and resy < N-1:
                 neighbors.append((resx, resy))
 
-        return neighbors
\ No newline at end of file
+        return neighbors
+
+
+    # The neighbors of all cells of an N x N grid, see NeighborTable.
+    def table(self, N):
+        return NeighborTable(self.coords, N)
+
+
+# The neighbors of the cells of an N x N grid as flat indices y * N + x, in the
+# same order as for_coords. offsets holds the index offset of every neighbor and
+# valid, for every cell, which of its neighbors lie within the border.
+# Most cells have all their neighbors within the border, so for the loops of
+# AntsCA only the neighbors of the cells close to the border are stored.
+class NeighborTable():
+    def __init__(self, coords, N):
+        dx = np.array([x for (x, _) in coords])
+        dy = np.array([y for (_, y) in coords])
+        cells = np.arange(N * N)
+        nx = (cells % N)[:, None] + dx
+        ny = (cells // N)[:, None] + dy
+
+        self.N = N
+        self.offsets = dy * N + dx
+        self.valid = (nx > 0) & (ny > 0) & (nx < N-1) & (ny < N-1)
+
+        self.__offsets = self.offsets.tolist()
+        self.__edge = {}
+        for i in np.flatnonzero(~self.valid.all(axis=1)).tolist():
+            self.__edge[i] = (i + self.offsets[self.valid[i]]).tolist()
+
+
+    # Flat indices of the neighbors of cell i within the border.
+    def of(self, i):
+        neighbors = self.__edge.get(i)
+        if neighbors is None:
+            return [i + offset for offset in self.__offsets]
+        return neighbors
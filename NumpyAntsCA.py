@@ -0,0 +1,599 @@
+"""
+NumPy engine for the ants Cellular Automaton.
+The state, pheromones and signal of the grid are kept in three arrays and
+the "sense" and "walk" rules are applied to all ants at once with masked
+array operations, instead of visiting every cell in Python.
+The rules are the same as in AntsCA, including the scan order in which
+ants claim empty cells during the walk.
+"""
+
+from AntsCA import AntsCA, Cell, grid_counts, place_randomly
+from TimeSeries import TimeSeries
+
+import Snapshot
+
+import numpy as np
+
+
+# Order in which VonNeumannNeighborhood(r=1) lists the neighbors of a cell,
+# as (dx, dy) and the direction an ant turns to face each of them.
+NEIGHBOR_DX = np.array([-1, 1, 0, 0])
+NEIGHBOR_DY = np.array([0, 0, 1, -1])
+NEIGHBOR_DIRS = np.array([Cell.WEST, Cell.EAST, Cell.SOUTH, Cell.NORTH])
+
+# The direction an ant faces after walking in a given direction.
+OPPOSITE = np.array([0, Cell.SOUTH, Cell.WEST, Cell.NORTH, Cell.EAST, 0, 0, 0, 0])
+
+# Ways to store the cells: the dtypes of the state, pheromones and signal,
+# and the number the pheromones are multiplied by when stored.
+# "exact" (17 bytes per cell) gives the same results as AntsCA.
+# "float32" (7 bytes) keeps about 7 significant digits of the pheromones,
+# so evaporation rounds slightly differently and neighbors that had equal
+# pheromones in AntsCA can differ, or the other way around.
+# "fixed16" (5 bytes) stores the pheromones in units of 1/60000. The default
+# evaporation (300 units) and trail of an ant (signal * 600 units) are exact,
+# other evaporation rates are rounded to a whole unit. Trails evaporate to
+# exactly 0, where with floats a tiny rest can be left for one more time step,
+# so runs differ from "exact" in the details. The negative pheromones of the
+# border, food and nest are not stored but follow from the state.
+# The signal of the compact layouts is 16 bits, so there can be at most 32767
+# food in total.
+CELLS = {
+    "exact": (np.uint8, np.float64, np.int64, 1.),
+    "float32": (np.uint8, np.float32, np.int16, 1.),
+    "fixed16": (np.uint8, np.uint16, np.int16, 60000.)
+}
+
+
+# The evaporation per time step in the units the pheromones are stored in.
+def evaporation(evaporate, scale):
+    return evaporate if scale == 1. else round(evaporate * scale)
+
+
+# Flat index offset of the cell each state points at, for a grid of width N.
+def direction_offsets(N):
+    offsets = np.zeros(len(Cell), dtype=np.int64)
+    offsets[Cell.NORTH] = -N
+    offsets[Cell.EAST] = 1
+    offsets[Cell.SOUTH] = N
+    offsets[Cell.WEST] = -1
+    return offsets
+
+
+# Flat indices of all ants, in the order the grid is scanned (row by row).
+def find_ants(state):
+    return np.flatnonzero((state >= Cell.NORTH) & (state <= Cell.STAY))
+
+
+# For each row, pick one of the candidates in mask uniformly using the
+# random numbers in u, the same way random.choice picks from a list.
+def choose(mask, u):
+    count = mask.sum(axis=1)
+    nth = (u * count).astype(np.int64)
+    return np.argmax(np.cumsum(mask, axis=1) > nth[:, None], axis=1)
+
+
+# The "sense" rule for all ants at once, see AntsCA.__sense_cell.
+# The arrays are flat and are updated in place. Stacked grids are supported
+# by giving the flat nest index of every N*N block in nests. The arrays can
+# also hold a band of rows of a grid, starting at row0.
+# Returns the number of ants that picked up food.
+def sense(state, pher, signal, N, nests, ants, u, init_signal, row0=0):
+    k = len(ants)
+    s = state[ants]
+    g = signal[ants].copy()
+    x = ants % N
+    y = ants // N % N + row0
+    prev = ants + direction_offsets(N)[s]
+
+    nest = nests[ants // (N * N)]
+    dx = nest % N - x
+    dy = (nest - ants - dx) // N
+
+    # Ants carrying food next to the nest drop it there and turn around.
+    at_nest = (g > 0) & (np.abs(dx) + np.abs(dy) == 1)
+    west_empty = state[ants - 1] == Cell.EMPTY
+    drop_dir = np.select([
+        at_nest & (dx > 0) & west_empty,
+        at_nest & (dx < 0) & west_empty,
+        at_nest & (dy > 0) & (state[ants + N] == Cell.EMPTY),
+        at_nest & (dy < 0) & (state[ants - N] == Cell.EMPTY)
+    ], [Cell.WEST, Cell.EAST, Cell.NORTH, Cell.SOUTH], 0)
+    delivered = nest[at_nest]
+    g[at_nest] = 0
+
+    # Other ants carrying food turn towards the nest.
+    returning = g > 0
+    h_dir = np.select([
+        returning & (dx > 0) & (state[ants + 1] == Cell.EMPTY) & (ants + 1 != prev),
+        returning & (dx < 0) & west_empty & (ants - 1 != prev)
+    ], [Cell.EAST, Cell.WEST], 0)
+    v_dir = np.select([
+        returning & (dy > 0) & (state[ants + N] == Cell.EMPTY) & (ants + N != prev),
+        returning & (dy < 0) & (state[ants - N] == Cell.EMPTY) & (ants - N != prev)
+    ], [Cell.SOUTH, Cell.NORTH], 0)
+
+    # The remaining ants turn to the neighbor with the highest pheromones,
+    # see AntsCA.__find_best_neighbor.
+    best_needed = (g == 0) | ((h_dir == 0) & (v_dir == 0))
+    nx = x[:, None] + NEIGHBOR_DX
+    ny = y[:, None] + NEIGHBOR_DY
+    neighbors = ants[:, None] + NEIGHBOR_DX + N * NEIGHBOR_DY
+    valid = (nx > 0) & (ny > 0) & (nx < N-1) & (ny < N-1)
+    nstate = state[neighbors]
+    is_prev = neighbors == prev[:, None]
+    is_food = nstate == Cell.FOOD
+
+    score = pher[neighbors].astype(np.float64)
+    score[is_prev | ((nstate >= Cell.NORTH) & (nstate <= Cell.STAY)) | is_food | (nstate == Cell.NEST)] = -2.
+    score[~valid] = -np.inf
+
+    # Searching ants next to food take one piece from the first food neighbor.
+    food_neighbors = valid & is_food & ~is_prev
+    picking = best_needed & (g == 0) & food_neighbors.any(axis=1)
+    picked = neighbors[np.arange(k), np.argmax(food_neighbors, axis=1)][picking]
+    g[picking] = init_signal
+
+    best = score.max(axis=1)
+    stay = best_needed & (best < 0.)
+    best_dir = NEIGHBOR_DIRS[choose(score == best[:, None], u[0])]
+
+    candidates = np.where(best_needed[:, None],
+                          np.stack([drop_dir, best_dir], axis=1),
+                          np.stack([h_dir, v_dir], axis=1))
+    direction = candidates[np.arange(k), choose(candidates != 0, u[1])]
+
+    state[ants] = np.where(stay, Cell.STAY, direction)
+    signal[ants] = g
+    np.add.at(signal, delivered, 1)
+
+    # Every ant takes food, but a food cell is only emptied once it runs out.
+    np.subtract.at(signal, picked, 1)
+    gone = picked[signal[picked] <= 0]
+    state[gone] = Cell.EMPTY
+    pher[gone] = 0.
+    signal[gone] = 0
+    return len(picked)
+
+
+# The "walk" rule for all ants at once, see AntsCA.__walk_cell.
+# Ants move in scan order, so an ant can only take a cell that was empty
+# and not taken by an earlier ant, or a cell that an earlier ant has left.
+# The pheromones are stored multiplied by scale, see CELLS, and evaporate
+# is given in the same units.
+def walk(state, pher, signal, N, ants, evaporate, init_signal, scale=1.):
+    k = len(ants)
+    s = state[ants]
+    g = signal[ants]
+    target = ants + direction_offsets(N)[s]
+    moving = s != Cell.STAY
+    tstate = state[target]
+
+    moved = np.zeros(k, dtype=bool)
+    dpher = np.zeros(k)
+    move_pher = np.zeros(k)
+    trail = g / init_signal if scale == 1. else np.rint(g * scale / init_signal)
+
+    # Empty cells go to the first ant that wants them. The pheromones there
+    # have already evaporated if the cell comes before the ant in scan order.
+    claims = np.flatnonzero(moving & (tstate == Cell.EMPTY))
+    _, first = np.unique(target[claims], return_index=True)
+    winners = claims[first]
+    moved[winners] = True
+    tpher = pher[target[winners]]
+    dpher[winners] = np.where(target[winners] > ants[winners],
+                              tpher, np.maximum(tpher, evaporate) - evaporate)
+
+    # Cells holding an ant can be taken once that ant has left, which is
+    # only possible if it came earlier in scan order. Resolve these chains
+    # from the front.
+    occupant = np.searchsorted(ants, target)
+    pending = np.flatnonzero(moving & (tstate >= Cell.NORTH) & (tstate <= Cell.STAY)
+                             & (target < ants))
+    resolved = np.ones(k, dtype=bool)
+    resolved[pending] = False
+    while True:
+        done = moved & resolved
+        move_pher[done] = np.where(g[done] > 0, trail[done], dpher[done])
+        if not pending.size:
+            break
+
+        ready = resolved[occupant[pending]]
+        claims = pending[ready]
+        _, first = np.unique(target[claims], return_index=True)
+        winners = claims[first]
+        winners = winners[moved[occupant[winners]]]
+        moved[winners] = True
+        dpher[winners] = move_pher[occupant[winners]]
+        resolved[claims] = True
+        pending = pending[~ready]
+
+    # Evaporate pheromones on the cells that were empty.
+    empty = state == Cell.EMPTY
+    pher[empty] = np.maximum(pher[empty], evaporate) - evaporate
+    signal[empty] = 0
+
+    origin = ants[moved]
+    dest = target[moved]
+    state[origin] = Cell.EMPTY
+    pher[origin] = move_pher[moved]
+    signal[origin] = 0
+
+    state[dest] = OPPOSITE[s[moved]]
+    pher[dest] = dpher[moved]
+    signal[dest] = np.where(g[moved] > 1, g[moved] - 1, g[moved])
+    state[ants[~moved]] = Cell.STAY
+
+    # Positions of the ants after the walk.
+    return np.where(moved, target, ants)
+
+
+# Read-only view of one row of a NumpyAntsCA as [Cell, pher, signal] lists.
+class GridRow():
+    def __init__(self, ca, y):
+        self.ca = ca
+        self.y = y
+
+    def __len__(self):
+        return self.ca.N
+
+    def __getitem__(self, x):
+        return [Cell(int(self.ca.state[self.y, x])), self.ca.pheromone(x, self.y),
+                int(self.ca.signal[self.y, x])]
+
+    def __iter__(self):
+        return (self[x] for x in range(self.ca.N))
+
+
+# Read-only view of a NumpyAntsCA grid, indexed as grid[y][x] like AntsCA.grid.
+class GridView():
+    def __init__(self, ca):
+        self.ca = ca
+
+    def __len__(self):
+        return self.ca.N
+
+    def __getitem__(self, y):
+        return GridRow(self.ca, y)
+
+    def __iter__(self):
+        return (self[y] for y in range(self.ca.N))
+
+
+class NumpyAntsCA(AntsCA):
+    # cells is one of CELLS, the way the cells are stored. A snapshot continues the run
+    # it was saved from, with its arrays memory-mapped and the cells it was saved with.
+    # A scenario is a grid made beforehand, see Scenario.py.
+    def __init__(self, food_sources=10, food_amount=10, N=50, ants_count=100, preset=None, seed=None, counter=None,
+                 cells="exact", snapshot=None, scenario=None, config=None):
+        self.configure(config)
+        if snapshot:
+            (arrays, info) = Snapshot.load(snapshot, mmap=True)
+            cells = info["cells"]
+        (self.state_dtype, self.pher_dtype, self.signal_dtype, self.pher_scale) = CELLS[cells]
+        self.cells = cells
+        self.FOOD_IN_NEST = 0
+        self.NEST_COORD = (0,0)
+        self.counter = TimeSeries(2, **(counter or {}))
+        self.ants_count = ants_count
+        self.INIT_N_FOOD = food_sources
+        self.INIT_FOOD_PER_SPOT = food_amount
+        self.rng = np.random.default_rng(seed)
+        self.grid = GridView(self)
+        self.ticks = 0
+        self.moved = 0
+        self.stalled = 0
+        self.picked_up = 0
+        self.stop_reason = None
+
+        if self.INIT_FOOD_PER_SPOT > np.iinfo(self.signal_dtype).max:
+            raise ValueError("Too much food for cells=\"" + cells + "\", use cells=\"exact\".")
+
+        if snapshot:
+            (self.state, self.pher, self.signal) = arrays
+            self.N = info["N"]
+            self.NEST_COORD = tuple(info["NEST_COORD"])
+        elif scenario is not None:
+            self.__load_arrays(*scenario)
+            (self.ants_count, self.INIT_N_FOOD, self.INIT_FOOD_PER_SPOT) = grid_counts(scenario[0], scenario[2])
+        elif preset:
+            self.load_file(preset)
+        else:
+            self.N = N
+            self.__init_arrays()
+            self.__init_border()
+            self.__populate_grid()
+
+        # The ants are kept in scan order, so the grid does not have to be searched for them.
+        self.__ants = find_ants(self.state.reshape(-1))
+        self.FOOD_TOTAL = int(self.signal[self.state == Cell.FOOD].sum())
+        if self.FOOD_TOTAL > np.iinfo(self.signal_dtype).max:
+            raise ValueError("Too much food for cells=\"" + cells + "\", use cells=\"exact\".")
+
+        if snapshot:
+            Snapshot.restore(self, snapshot, info, seed)
+            self.configure(config)
+        else:
+            self.counter.append([0,0])
+
+
+    def __init_arrays(self):
+        self.state = np.full((self.N, self.N), Cell.EMPTY, dtype=self.state_dtype)
+        self.pher = np.zeros((self.N, self.N), dtype=self.pher_dtype)
+        self.signal = np.zeros((self.N, self.N), dtype=self.signal_dtype)
+
+
+    # Make the grid from the arrays of the exact layout. The negative pheromones
+    # of the border, food and nest are left out of the fixed-point layout.
+    def __load_arrays(self, state, pher, signal):
+        if signal.max() > np.iinfo(self.signal_dtype).max:
+            raise ValueError("Too much food for cells=\"" + self.cells + "\", use cells=\"exact\".")
+
+        self.N = len(state)
+        self.__init_arrays()
+        self.state[:] = state
+        self.signal[:] = signal
+        if self.pher_scale == 1.:
+            self.pher[:] = pher
+        else:
+            self.pher[:] = np.rint(np.maximum(pher, 0.) * self.pher_scale)
+        (y, x) = np.argwhere(self.state == Cell.NEST)[0].tolist()
+        self.NEST_COORD = (x, y)
+
+
+    # Store the negative pheromones of the border, food and nest,
+    # which are left out when the pheromones are unsigned.
+    def __set_marker(self, index, pher):
+        if np.dtype(self.pher_dtype).kind != "u":
+            self.pher[index] = pher
+
+
+    # Load a preset grid in the same format as AntsCA.load_file.
+    def load_file(self, preset):
+        with open(preset) as f:
+            lines = [line.rstrip("\n") for line in f.readlines()]
+
+        self.N = len(lines[0])
+        self.__init_arrays()
+
+        for y, line in enumerate(lines):
+            for x, char in enumerate(line):
+                if char == "B":
+                    self.state[y, x] = Cell.BORDER
+                    self.__set_marker((y, x), self.BORDER_PHER)
+                elif char == "N":
+                    self.NEST_COORD = (x, y)
+                    self.state[y, x] = Cell.NEST
+                    self.__set_marker((y, x), -2)
+                elif char == "A":
+                    self.state[y, x] = Cell.NORTH
+                elif char == "F":
+                    self.state[y, x] = Cell.FOOD
+                    self.__set_marker((y, x), self.FOOD_PHER)
+                    self.signal[y, x] = self.INIT_FOOD_PER_SPOT
+
+        self.__turn_randomly(find_ants(self.state.reshape(-1)))
+
+
+    # Turn the ants at the flat indices in random directions, drawn all at once as in AntsCA.
+    def __turn_randomly(self, ants):
+        self.state.reshape(-1)[ants] = self.rng.integers(Cell.NORTH, Cell.WEST + 1, size=len(ants))
+
+
+    def __init_border(self):
+        for edge in [(0, slice(None)), (-1, slice(None)), (slice(None), 0), (slice(None), -1)]:
+            self.state[edge] = Cell.BORDER
+            self.__set_marker(edge, self.BORDER_PHER)
+
+
+    # Initializing the nest, food cells and ants, as in AntsCA.
+    def __populate_grid(self):
+        x = int(self.N / 2)
+        y = 2
+        self.state[y, x] = Cell.NEST
+        self.__set_marker((y, x), -2)
+        self.NEST_COORD = (x,y)
+
+        (food, ants, directions) = place_randomly(self.rng, self.N, y * self.N + x, self.INIT_N_FOOD, self.ants_count)
+        food = np.unravel_index(food, self.state.shape)
+        self.state[food] = Cell.FOOD
+        self.__set_marker(food, self.FOOD_PHER)
+        self.signal[food] = self.INIT_FOOD_PER_SPOT
+        self.state.reshape(-1)[ants] = directions
+
+
+    # Get the current pheromones on the cell at x, y.
+    def pheromone(self, x, y):
+        if self.pher_scale == 1.:
+            return float(self.pher[y, x])
+        return float(self.__markers().get(self.state[y, x], self.pher[y, x] / self.pher_scale))
+
+
+    # The pheromones of all cells as floats, the array itself if they are stored as floats.
+    def pheromones(self):
+        if self.pher_scale == 1.:
+            return self.pher
+
+        pher = self.pher / self.pher_scale
+        for (state, marker) in self.__markers().items():
+            pher[self.state == state] = marker
+        return pher
+
+
+    # Pheromones of the cells that are not stored in the fixed-point layout.
+    def __markers(self):
+        return {Cell.BORDER: self.BORDER_PHER, Cell.FOOD: self.FOOD_PHER, Cell.NEST: -2}
+
+
+    # The pheromones in the arrays are always up to date.
+    def sync_pheromones(self):
+        pass
+
+
+    # Flat index of the nest.
+    def __nest_index(self):
+        (x, y) = self.NEST_COORD
+        return y * self.N + x
+
+
+    # Advance the CA one time step.
+    def evolve(self):
+        self.__sense()
+        self.__walk()
+        self.__count()
+        self.ticks += 1
+
+
+    # Hash of the complete grid, to recognise a grid seen before.
+    def state_hash(self):
+        return hash((self.state.tobytes(), self.pher.tobytes(), self.signal.tobytes()))
+
+
+    def __sense(self):
+        u = self.rng.random((2, len(self.__ants)))
+        self.picked_up = sense(self.state.reshape(-1), self.pher.reshape(-1), self.signal.reshape(-1), self.N,
+              np.array([self.__nest_index()]), self.__ants, u, self.INIT_ANT_SIGNAL)
+
+
+    def __walk(self):
+        ants = walk(self.state.reshape(-1), self.pher.reshape(-1), self.signal.reshape(-1), self.N,
+                    self.__ants, evaporation(self.PHER_EVAPORATE, self.pher_scale), self.INIT_ANT_SIGNAL,
+                    self.pher_scale)
+        self.moved = int(np.count_nonzero(ants != self.__ants))
+        self.stalled = len(ants) - self.moved
+        self.__ants = np.sort(ants)
+
+
+    # Count variables of AntsCA for graphs, only looking at the nest and the ants.
+    def __count(self):
+        self.FOOD_IN_NEST = int(self.signal.reshape(-1)[self.__nest_index()])
+        on_pher = int(np.count_nonzero(self.pher.reshape(-1)[self.__ants] > 0))
+        self.counter.append([self.FOOD_IN_NEST, on_pher])
+
+
+# Many independent colonies on grids of the same size, advanced at once.
+# The grids are stacked in (B, N, N) arrays, and colony b behaves exactly like
+# NumpyAntsCA with the same parameters and seed. A colony stops once all its
+# food is in the nest, or another stop condition of run is met, and is left
+# out of the following time steps.
+class EnsembleAntsCA():
+    PHER_EVAPORATE = AntsCA.PHER_EVAPORATE
+    INIT_ANT_SIGNAL = AntsCA.INIT_ANT_SIGNAL
+
+    # food_sources, food_amount, ants_count, seeds and counter can be given per colony.
+    # counter holds the options of the TimeSeries of the counters; a stream given for all
+    # colonies gets the number of the colony as suffix, e.g. counter.bin.3. cells is one of CELLS.
+    # scenarios can hold the starting grids of the colonies, made by Scenario.batch.
+    # config holds the configuration variables of all colonies, see AntsCA.configure.
+    def __init__(self, B, food_sources=10, food_amount=10, N=50, ants_count=100, seeds=None, counter=None,
+                 cells="exact", scenarios=None, config=None):
+        if seeds is None:
+            seeds = np.random.SeedSequence().spawn(B)
+        per_colony = lambda value: list(value) if np.ndim(value) else [value] * B
+        grids = list(zip(*scenarios)) if scenarios is not None else [None] * B
+        if isinstance(counter, dict) and counter.get("stream"):
+            counter = [dict(counter, stream=counter["stream"] + "." + str(b)) for b in range(B)]
+
+        colonies = [NumpyAntsCA(food_sources=sources, food_amount=amount, N=N, ants_count=ants, seed=seed,
+                                counter=options, cells=cells, scenario=grid, config=config)
+                    for (sources, amount, ants, seed, options, grid)
+                    in zip(per_colony(food_sources), per_colony(food_amount), per_colony(ants_count),
+                           per_colony(seeds), per_colony(counter), grids)]
+
+        self.B = B
+        AntsCA.configure(self, config)
+        self.N = colonies[0].N
+        self.NEST_COORD = colonies[0].NEST_COORD
+        self.FOOD_TOTAL = np.array([ca.FOOD_TOTAL for ca in colonies])
+        self.state = np.stack([ca.state for ca in colonies])
+        self.pher = np.stack([ca.pher for ca in colonies])
+        self.signal = np.stack([ca.signal for ca in colonies])
+        self.rngs = [ca.rng for ca in colonies]
+        self.pher_scale = colonies[0].pher_scale
+        self.counters = [ca.counter for ca in colonies]
+        self.finished = np.zeros(B, dtype=bool)
+        self.stop_reasons = [None] * B
+        self.moved = np.zeros(B, dtype=np.int64)
+        self.target = 1.
+
+
+    # Advance all colonies that are not finished one time step.
+    def evolve(self):
+        active = np.flatnonzero(~self.finished)
+        if not active.size:
+            return
+
+        if active.size == self.B:
+            (state, pher, signal) = (self.state, self.pher, self.signal)
+        else:
+            (state, pher, signal) = (self.state[active], self.pher[active], self.signal[active])
+
+        self.__step(active, state.reshape(-1), pher.reshape(-1), signal.reshape(-1))
+
+        if active.size != self.B:
+            self.state[active] = state
+            self.pher[active] = pher
+            self.signal[active] = signal
+
+        self.__count(active, state, pher, signal)
+
+
+    # Advance until every colony has stopped, with the stop conditions of AntsCA.run
+    # applied to each colony, and return the reasons the colonies stopped.
+    # As there, max_ticks counts the time steps of this call.
+    def run(self, max_ticks=None, stall_ticks=None, target=1.):
+        self.target = target
+        idle = np.zeros(self.B, dtype=np.int64)
+        ticks = 0
+
+        while not self.finished.all():
+            active = ~self.finished
+            food = self.signal[:, self.NEST_COORD[1], self.NEST_COORD[0]].copy()
+            self.evolve()
+            ticks += 1
+
+            food_same = self.signal[:, self.NEST_COORD[1], self.NEST_COORD[0]] == food
+            idle = np.where((self.moved == 0) & food_same, idle + 1, 0)
+            for b in np.flatnonzero(active & ~self.finished):
+                if max_ticks is not None and ticks >= max_ticks:
+                    self.__stop(b, "max_ticks")
+                elif stall_ticks is not None and idle[b] >= stall_ticks:
+                    self.__stop(b, "stalled")
+
+        for counter in self.counters:
+            counter.close()
+        return self.stop_reasons
+
+
+    def __stop(self, b, reason):
+        self.finished[b] = True
+        self.stop_reasons[b] = reason
+
+
+    def __step(self, active, state, pher, signal):
+        N = self.N
+        (x, y) = self.NEST_COORD
+        nests = np.arange(len(active)) * N * N + y * N + x
+
+        # Every colony draws its random numbers from its own stream.
+        ants = find_ants(state)
+        counts = np.bincount(ants // (N * N), minlength=len(active))
+        u = np.concatenate([self.rngs[b].random((2, k)) for (b, k) in zip(active, counts)], axis=1)
+
+        sense(state, pher, signal, N, nests, ants, u, self.INIT_ANT_SIGNAL)
+        moved = walk(state, pher, signal, N, ants, evaporation(self.PHER_EVAPORATE, self.pher_scale),
+                     self.INIT_ANT_SIGNAL, self.pher_scale) != ants
+        self.moved[active] = np.bincount(ants[moved] // (N * N), minlength=len(active))
+
+
+    # Count variables for graphs, and finish the colonies with enough food in the nest.
+    def __count(self, active, state, pher, signal):
+        (x, y) = self.NEST_COORD
+        food = signal[:, y, x]
+        ants = (state >= Cell.NORTH) & (state <= Cell.STAY)
+        on_pher = np.count_nonzero(ants & (pher > 0), axis=(1, 2))
+
+        for (b, f, p) in zip(active, food, on_pher):
+            self.counters[b].append([int(f), int(p)])
+            if f >= self.target * self.FOOD_TOTAL[b]:
+                self.__stop(b, "food")
@@ -0,0 +1,70 @@
+"""
+Opt-in profiling of a CA. The phases of evolve and the main helpers are
+wrapped on the instance only while profiling, so a CA that is not profiled
+runs the same code as before.
+"""
+
+import time
+
+
+# The methods that are timed, without the name-mangling prefix of the class.
+# Methods the CA does not have are skipped.
+METHODS = ["evolve", "__sense", "__walk", "__count", "__find_best_neighbor",
+           "__return_direction", "__next_grid", "__swap"]
+
+
+class Profiler():
+    def __init__(self, ca, methods=METHODS):
+        self.ca = ca
+        self.calls = {}
+        self.times = {}
+        self.moved = []
+        self.stalled = []
+        self.picked_up = []
+        self.wrapped = []
+
+        for method in methods:
+            name = method.lstrip("_")
+            attr = "_" + type(ca).__name__ + method if method.startswith("__") else method
+            if hasattr(ca, attr):
+                self.calls[name] = 0
+                self.times[name] = 0.
+                setattr(ca, attr, self.__wrap(name, getattr(ca, attr)))
+                self.wrapped.append(attr)
+
+
+    # Time a method and count its calls. After each time step the
+    # number of ants moved, stalled and picking up food is recorded.
+    def __wrap(self, name, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.times[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+            if name == "evolve":
+                self.moved.append(self.ca.moved)
+                self.stalled.append(self.ca.stalled)
+                self.picked_up.append(self.ca.picked_up)
+            return result
+
+        return wrapper
+
+
+    # Stop profiling, the CA runs its own methods again.
+    def stop(self):
+        for attr in self.wrapped:
+            delattr(self.ca, attr)
+        self.wrapped = []
+
+
+    # The calls and wall time of each method, in seconds and including the methods
+    # it calls, and the ants moved, stalled and picking up food per time step.
+    def report(self):
+        return {
+            "ticks": len(self.moved),
+            "methods": {name: {"calls": self.calls[name], "time": self.times[name]} for name in self.calls},
+            "moved": list(self.moved),
+            "stalled": list(self.stalled),
+            "picked_up": list(self.picked_up)
+        }
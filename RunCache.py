@@ -0,0 +1,139 @@
+"""
+On-disk cache of finished runs, so sweeps that overlap with earlier ones only
+compute the runs that are missing. A run is stored under the hash of everything
+that decides its outcome: the version of the engines, the engine and its options,
+all parameters of the CA (with the contents of a preset file), the seed, the
+stop conditions and the options of the counter. The version of the engines is
+the hash of their source files, so changing the rules starts a new cache.
+
+Every entry is a .npz file with the rows of the counter and a summary of the run
+(its iterations, final food in the nest and stop reason). The cache is kept below
+max_bytes by removing the least recently used entries:
+
+cache = RunCache("runs.cache", max_bytes=2**30)
+results = sweep.run(NumpyAntsCA, seed=1, cache=cache)
+"""
+
+import hashlib
+import json
+import os
+
+from functools import partial
+
+import numpy as np
+
+from TimeSeries import TimeSeries
+
+
+# The source files of the engines and the parts they are made of.
+ENGINE_FILES = ["AntsCA.py", "NumpyAntsCA.py", "JitAntsCA.py", "TiledAntsCA.py", "Neighborhood.py", "TimeSeries.py"]
+
+
+# Hash of the source files of the engines.
+def engine_version():
+    digest = hashlib.sha256()
+    for name in ENGINE_FILES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# The engine as plain values, e.g. ["NumpyAntsCA", {"cells": "float32"}] for an engine of food.engines.
+def describe(engine):
+    if isinstance(engine, partial):
+        return [describe(engine.func), list(engine.args), {k: repr(v) for (k, v) in sorted(engine.keywords.items())}]
+    return engine.__module__ + "." + engine.__qualname__
+
+
+class RunCache():
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = engine_version()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+        # The size and last use of every entry, to evict without listing the directory again.
+        self.entries = {}
+        for name in os.listdir(path):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(path, name))
+                self.entries[name[:-len(".npz")]] = (stat.st_size, stat.st_mtime)
+
+
+    # The key of a run. Runs streaming their counter to a file are not cached and have no key.
+    def key(self, engine, parameters, seed, stop=None, counter=None):
+        if counter and counter.get("stream"):
+            return None
+
+        parameters = dict(parameters)
+        if parameters.get("preset"):
+            with open(parameters["preset"], "rb") as f:
+                parameters["preset"] = hashlib.sha256(f.read()).hexdigest()
+
+        run = {"version": self.version, "engine": describe(engine), "parameters": parameters, "seed": int(seed),
+               "stop": stop or {}, "counter": counter or {}}
+        return hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()
+
+
+    def file(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+
+    # The counter and the stop reason of a cached run, or None if it is not cached.
+    # counter holds the options of the TimeSeries, as for the run itself.
+    def get(self, key, counter=None):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        try:
+            with np.load(self.file(key)) as entry:
+                (rows, count, reason) = (entry["rows"], int(entry["count"]), str(entry["reason"]))
+        except (OSError, ValueError, KeyError):
+            # An entry that was removed or cut off by another process is computed again.
+            self.entries.pop(key)
+            self.misses += 1
+            return None
+
+        series = TimeSeries(rows.shape[1], dtype=rows.dtype, **(counter or {}))
+        series.extend(rows, count)
+
+        # Mark the entry as used.
+        os.utime(self.file(key))
+        self.entries[key] = (self.entries[key][0], os.stat(self.file(key)).st_mtime)
+        self.hits += 1
+        return (series, reason)
+
+
+    # Store a finished run, and remove the least recently used runs if the cache got too big.
+    def put(self, key, counter, reason):
+        rows = counter.array()
+        temp = self.file(key) + "." + str(os.getpid()) + ".tmp"
+        with open(temp, "wb") as f:
+            np.savez(f, rows=rows, count=counter.count, reason=reason,
+                     food=rows[-1, 0] if len(rows) else 0)
+        os.replace(temp, self.file(key))
+
+        stat = os.stat(self.file(key))
+        self.entries[key] = (stat.st_size, stat.st_mtime)
+        self.evict()
+
+
+    def evict(self):
+        size = sum(entry[0] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key][1]):
+            if size <= self.max_bytes:
+                break
+            size -= self.entries.pop(key)[0]
+            try:
+                os.remove(self.file(key))
+            except FileNotFoundError:
+                pass
+
+
+    # The summary of a cached run: its iterations, final food in the nest and stop reason.
+    def summary(self, key):
+        with np.load(self.file(key)) as entry:
+            return {"iterations": int(entry["count"]), "food": int(entry["food"]), "reason": str(entry["reason"])}
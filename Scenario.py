@@ -0,0 +1,49 @@
+"""
+Starting grids for the ants CA, made before the runs. A grid is given as the
+arrays state, pher and signal of the exact layout of NumpyAntsCA, and can be
+passed to AntsCA, NumpyAntsCA, JitAntsCA or TiledAntsCA as scenario. The grids
+for the runs of a sweep are made in one batch and stacked in (B, N, N) arrays,
+each with its own seed, e.g. from Sweep.run_seed:
+
+(state, pher, signal) = batch(50, [(10, 18), (20, 9)], 100, seeds)
+ca = AntsCA(scenario=(state[1], pher[1], signal[1]), seed=seeds[1])
+
+The food and ants are placed as by the engines themselves (place_randomly), so a
+grid made with a seed is the grid the engines make with that seed. The time steps
+of a run given a scenario are drawn from a new generator for its seed.
+"""
+
+import numpy as np
+
+from AntsCA import AntsCA, Cell, place_randomly
+
+
+# A new N x N grid with the food and ants placed at random, see AntsCA.__populate_grid.
+def grid(N, food_sources, food_amount, ants_count, seed=None):
+    rng = np.random.default_rng(seed)
+    state = np.full((N, N), Cell.EMPTY, dtype=np.uint8)
+    pher = np.zeros((N, N))
+    signal = np.zeros((N, N), dtype=np.int64)
+
+    for edge in [(0, slice(None)), (-1, slice(None)), (slice(None), 0), (slice(None), -1)]:
+        state[edge] = Cell.BORDER
+        pher[edge] = AntsCA.BORDER_PHER
+
+    nest = (2, int(N / 2))
+    state[nest] = Cell.NEST
+    pher[nest] = -2
+
+    (food, ants, directions) = place_randomly(rng, N, nest[0] * N + nest[1], food_sources, ants_count)
+    food = np.unravel_index(food, (N, N))
+    state[food] = Cell.FOOD
+    pher[food] = AntsCA.FOOD_PHER
+    signal[food] = food_amount
+    state.reshape(-1)[ants] = directions
+    return (state, pher, signal)
+
+
+# The grids for runs of (sources, amount) pairs with the same number of ants,
+# each made with its own seed, as stacked arrays state, pher and signal.
+def batch(N, runs, ants_count, seeds):
+    grids = [grid(N, sources, amount, ants_count, seed) for ((sources, amount), seed) in zip(runs, seeds)]
+    return tuple(np.stack(arrays) for arrays in zip(*grids))
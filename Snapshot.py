@@ -0,0 +1,96 @@
+"""
+Binary snapshots of the complete state of a CA in the middle of a run,
+to continue it later or to start many runs from the same point.
+A snapshot is a directory with one .npy file per array of the grid
+(state, pher and signal, as in NumpyAntsCA), counter.npy with the rows of
+the counter, and snapshot.json with the time step, the nest, the food and
+the state of the random number generator.
+
+The arrays are memory-mapped copy-on-write when loaded by NumpyAntsCA,
+so CAs forked from one snapshot share its pages until they change them:
+
+ca.save_snapshot("warm.snap")
+runs = fork(NumpyAntsCA, "warm.snap", [.001, .005, .01])
+"""
+
+import json
+import os
+
+from itertools import chain
+
+import numpy as np
+
+
+ARRAYS = ["state", "pher", "signal"]
+
+
+# Save the CA to a snapshot in a directory.
+def save(ca, path):
+    ca.sync_pheromones()
+    if isinstance(getattr(ca, "state", None), np.ndarray):
+        arrays = [ca.state, ca.pher, ca.signal]
+    else:
+        # The grid of AntsCA is stored in the arrays of the exact layout of NumpyAntsCA.
+        cells = chain.from_iterable(chain.from_iterable(ca.grid))
+        cells = np.fromiter(cells, np.float64, count=3 * ca.N * ca.N).reshape(ca.N, ca.N, 3)
+        arrays = [cells[:, :, 0].astype(np.uint8), cells[:, :, 1], cells[:, :, 2].astype(np.int64)]
+
+    os.makedirs(path, exist_ok=True)
+    for (name, array) in zip(ARRAYS, arrays):
+        np.save(os.path.join(path, name + ".npy"), array)
+    np.save(os.path.join(path, "counter.npy"), ca.counter.array())
+
+    info = {
+        "engine": type(ca).__name__,
+        "cells": getattr(ca, "cells", "exact"),
+        "N": ca.N,
+        "NEST_COORD": [int(c) for c in ca.NEST_COORD],
+        "FOOD_IN_NEST": int(ca.FOOD_IN_NEST),
+        "FOOD_TOTAL": int(ca.FOOD_TOTAL),
+        "ticks": ca.ticks,
+        "counter_count": ca.counter.count,
+        "ants_count": ca.ants_count,
+        "INIT_N_FOOD": ca.INIT_N_FOOD,
+        "INIT_FOOD_PER_SPOT": ca.INIT_FOOD_PER_SPOT,
+        "PHER_EVAPORATE": ca.PHER_EVAPORATE,
+        "rng": ca.rng.bit_generator.state
+    }
+    with open(os.path.join(path, "snapshot.json"), "w") as f:
+        json.dump(info, f)
+
+
+# The arrays of a snapshot, memory-mapped copy-on-write if mmap is set,
+# and its other values.
+def load(path, mmap=False):
+    with open(os.path.join(path, "snapshot.json")) as f:
+        info = json.load(f)
+    arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode="c" if mmap else None) for name in ARRAYS]
+    return (arrays, info)
+
+
+# Continue the run of the snapshot in a CA made from its grid: the time step,
+# the food, the counter and, unless the CA was given a seed of its own, the
+# random number generator.
+def restore(ca, path, info, seed=None):
+    ca.ticks = info["ticks"]
+    ca.ants_count = info["ants_count"]
+    ca.INIT_N_FOOD = info["INIT_N_FOOD"]
+    ca.INIT_FOOD_PER_SPOT = info["INIT_FOOD_PER_SPOT"]
+    ca.FOOD_IN_NEST = info["FOOD_IN_NEST"]
+    ca.FOOD_TOTAL = info["FOOD_TOTAL"]
+    ca.PHER_EVAPORATE = info["PHER_EVAPORATE"]
+    ca.counter.extend(np.load(os.path.join(path, "counter.npy")), info["counter_count"])
+
+    if seed is None:
+        ca.rng.bit_generator.state = info["rng"]
+
+
+# CAs that continue from a snapshot, one for every evaporation rate.
+# options are passed on to the engine, e.g. seed or counter.
+def fork(engine, path, evaporates, **options):
+    forks = []
+    for evaporate in evaporates:
+        ca = engine(snapshot=path, **options)
+        ca.PHER_EVAPORATE = evaporate
+        forks.append(ca)
+    return forks
@@ -0,0 +1,267 @@
+"""
+Sweeps over the parameters of the ants CA. A sweep is a grid of values for
+each parameter that is varied; every combination of them is a point, and every
+point is run a number of times (replicates). The parameters that are the same for
+all runs are given as fixed, e.g. the evaporation sweep of graphs.py:
+
+sweep = Sweep({"PHER_EVAPORATE": np.linspace(.001, .0099, 10)}, replicates=3, fixed={"N": 50})
+results = sweep.run(AntsCA, seed=1, workers=4, path="evaporation")
+
+The configuration variables of AntsCA, such as PHER_EVAPORATE and INIT_ANT_SIGNAL, are
+passed to the engine as its config; the others, such as N, ants_count, food_sources,
+food_amount or radius, as arguments. "food" sweeps over (sources, amount)
+pairs together.
+A sweep can also be read from a JSON file with the keys params, replicates and fixed.
+
+All runs go into one Results store, with the value of every parameter per run, so the
+plots of food.py and graphs.py read them from there.
+"""
+
+import hashlib
+import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+
+from AntsCA import AntsCA
+from NumpyAntsCA import EnsembleAntsCA
+from Profiler import Profiler
+from results import Results, check_target
+
+
+# The parameters the ensemble engine can give every colony of a batch.
+PER_COLONY = ["food_sources", "food_amount", "ants_count"]
+
+
+class Sweep():
+    def __init__(self, params, replicates=1, fixed=None):
+        self.params = params
+        self.replicates = replicates
+        self.fixed = {name: plain(value) for (name, value) in (fixed or {}).items()}
+
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec["params"], spec.get("replicates", 1), spec.get("fixed"))
+
+
+    # The points of the sweep as dictionaries of parameter values, in the order of params
+    # with the last parameter changing fastest. "food" is split into food_sources and food_amount.
+    def points(self):
+        points = []
+        for values in product(*self.params.values()):
+            point = {}
+            for (name, value) in zip(self.params, values):
+                if name == "food":
+                    (point["food_sources"], point["food_amount"]) = map(plain, value)
+                else:
+                    point[name] = plain(value)
+            points.append(point)
+        return points
+
+
+    # Every replicate of every point, as (point, replicate).
+    def runs(self):
+        return [(point, replicate) for point in self.points() for replicate in range(self.replicates)]
+
+
+    # Run the sweep and return its Results, saved to path if given.
+    # See run_all for the other options.
+    def run(self, engine=AntsCA, seed=None, workers=1, stop=None, counter=None, telemetry=None, path=None,
+            cache=None):
+        if path:
+            check_target(path)
+        seed = experiment_seed(seed)
+        runs = self.runs()
+        (counters, reasons, _) = run_all(engine, runs, seed, workers, stop=stop, counter=counter,
+                                         telemetry=telemetry, fixed=self.fixed, cache=cache)
+
+        results = Results.from_runs(runs, counters, reasons, self.fixed)
+        if path:
+            results.save(path)
+        return results
+
+
+# A parameter value as a plain Python value, so it can be hashed into a seed and written to JSON.
+def plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# Pick a random seed for an experiment if none is given, and show it so it can be repeated.
+def experiment_seed(seed):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print("Seed: " + str(seed))
+    return seed
+
+
+# Seed of a single run, derived from the seed of the experiment, the names and values of
+# the parameters of the point and the replicate. Runs give the same results however they
+# are divided over workers. The seeds have 128 bits, so the runs of an experiment get
+# independent random streams.
+def run_seed(seed, point, replicate):
+    digest = hashlib.sha256(json.dumps(point, sort_keys=True).encode()).digest()
+    entropy = [int(seed), int.from_bytes(digest, "little"), int(replicate)]
+    return int.from_bytes(np.random.SeedSequence(entropy).generate_state(4).tobytes(), "little")
+
+
+# Whether a parameter is one of the configuration variables of AntsCA.
+def configuration(name):
+    return name.isupper() and hasattr(AntsCA, name)
+
+
+# Make a CA for the parameters: the configuration variables are passed as its config,
+# so they are set before the grid is made, and the others as arguments.
+def make(engine, parameters, **options):
+    config = {name: value for (name, value) in parameters.items() if configuration(name)}
+    if config:
+        options["config"] = config
+    return engine(**{name: value for (name, value) in parameters.items() if not configuration(name)}, **options)
+
+
+# Run a colony until it stops and return its counter, the reason it stopped,
+# when profiling the report of the Profiler, and the wall time in seconds.
+# By default it stops once all food is in the nest, stop holds the other stop conditions of AntsCA.run
+# and counter the options of the TimeSeries of the counter. A streamed counter is closed
+# once the run has finished.
+def run(engine, parameters, seed=None, stop=None, profile=False, counter=None):
+    ca = make(engine, parameters, seed=seed, counter=counter)
+    profiler = Profiler(ca) if profile else None
+    start = time.perf_counter()
+    reason = ca.run(**(stop or {}))
+    ca.counter.close()
+    return (ca.counter, reason, profiler.report() if profiler else None, time.perf_counter() - start)
+
+
+# Run a batch of colonies and return their counters, stop reasons, profiles and wall times.
+# The ensemble engine runs the whole batch at once, so each colony gets an equal share of
+# the wall time, and can not be profiled. Its colonies only differ in PER_COLONY.
+# counters holds the options of the counter of every run.
+def run_batch(engine, batch, seeds, stop=None, profile=False, counters=None):
+    counters = counters or [None] * len(batch)
+    if engine is EnsembleAntsCA:
+        shared = {name: value for (name, value) in batch[0].items() if name not in PER_COLONY}
+        colonies = {name: [parameters[name] for parameters in batch] for name in PER_COLONY if name in batch[0]}
+        ensemble = make(EnsembleAntsCA, dict(shared, **colonies), B=len(batch), seeds=seeds, counter=counters)
+        # The ensemble does not look for repeated grids.
+        start = time.perf_counter()
+        reasons = ensemble.run(**{k: v for (k, v) in (stop or {}).items() if k != "detect_repeats"})
+        seconds = (time.perf_counter() - start) / len(batch)
+        return [(counter, reason, None, seconds) for (counter, reason) in zip(ensemble.counters, reasons)]
+
+    return [run(engine, parameters, seed, stop, profile, counter)
+            for (parameters, seed, counter) in zip(batch, seeds, counters)]
+
+
+# Run the batches of runs, in this process or in a pool of worker processes,
+# and yield (batch, results) for each batch as soon as it has finished.
+def finished_batches(engine, parameters, seeds, batches, workers, stop, profile, counters):
+    jobs = [(engine, [parameters[i] for i in batch], [seeds[i] for i in batch], stop, profile,
+             [counters[i] for i in batch]) for batch in batches]
+
+    if workers == 1:
+        for (batch, job) in zip(batches, jobs):
+            yield (batch, run_batch(*job))
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(run_batch, *job): batch for (batch, job) in zip(batches, jobs)}
+        for future in as_completed(futures):
+            yield (futures[future], future.result())
+
+
+# Divide the runs todo, given by their index, into batches. The ensemble engine runs the runs that
+# only differ in PER_COLONY together, split in one batch per worker, the other engines one run per batch.
+# The batches on the largest grids go first, so the workers are not left waiting on them at the end.
+def schedule(engine, parameters, workers, todo):
+    if engine is EnsembleAntsCA:
+        groups = {}
+        for i in todo:
+            key = tuple((name, value) for (name, value) in parameters[i].items() if name not in PER_COLONY)
+            groups.setdefault(key, []).append(i)
+        batches = []
+        for group in groups.values():
+            size = -(-len(group) // workers)
+            batches += [group[i:i + size] for i in range(0, len(group), size)]
+    else:
+        batches = [[i] for i in todo]
+
+    return sorted(batches, key=lambda batch: -parameters[batch[0]].get("N", 0))
+
+
+# Run a colony for each (point, replicate) and return their counters, stop reasons
+# and profiles in the same order. fixed holds the parameters that are the same for every point.
+# A counter streamed to a file is streamed to a file of its own for every run, with the index
+# of the run as suffix, e.g. counter.bin.12.
+# If given, finished(run, counter, reason, profile) is called for each run as soon as it has finished,
+# and every finished run is recorded in the telemetry.
+# With a RunCache, the runs found in it are not run again (unless profiling) and the others are added.
+# Runs from the cache are passed to finished, without a profile, but not recorded in the telemetry.
+def run_all(engine, runs, seed, workers=1, finished=None, stop=None, profile=False, counter=None,
+            telemetry=None, fixed=None, cache=None):
+    seeds = [run_seed(seed, point, replicate) for (point, replicate) in runs]
+    parameters = [dict(fixed or {}, **point) for (point, _) in runs]
+
+    counters = [None] * len(runs)
+    reasons = [None] * len(runs)
+    profiles = [None] * len(runs)
+    options = [dict(counter, stream=counter["stream"] + "." + str(i)) if counter and counter.get("stream") else counter
+               for i in range(len(runs))]
+    keys = [cache.key(engine, p, s, stop, counter) if cache else None for (p, s) in zip(parameters, seeds)]
+    todo = []
+    for (i, key) in enumerate(keys):
+        cached = cache.get(key, counter) if key and not profile else None
+        if cached:
+            (counters[i], reasons[i]) = cached
+            if finished:
+                finished(runs[i], counters[i], reasons[i], None)
+        else:
+            todo.append(i)
+
+    done = len(runs) - len(todo)
+    if cache:
+        print("Runs cached: " + str(done) + "/" + str(len(runs)))
+    if telemetry:
+        telemetry.expect(len(todo))
+    batches = schedule(engine, parameters, workers, todo)
+    for (batch, result) in finished_batches(engine, parameters, seeds, batches, workers, stop, profile, options):
+        for (i, (series, reason, report, seconds)) in zip(batch, result):
+            counters[i] = series
+            reasons[i] = reason
+            profiles[i] = report
+            if keys[i]:
+                cache.put(keys[i], series, reason)
+            if finished:
+                finished(runs[i], series, reason, report)
+            if telemetry:
+                (point, replicate) = runs[i]
+                telemetry.run(point, replicate, series.count - 1, seconds, reason)
+        done += len(batch)
+        print("Runs done: " + str(done) + "/" + str(len(runs)))
+
+    print_reasons(reasons)
+    if profile:
+        print_slowest(runs, profiles)
+    return (counters, reasons, profiles)
+
+
+# Show how many runs stopped for each reason.
+def print_reasons(reasons):
+    for reason in sorted(set(reasons)):
+        print("Stopped by " + reason + ": " + str(reasons.count(reason)))
+
+
+# Show the runs that took the longest per time step, and where that time went.
+def print_slowest(runs, profiles, n=3):
+    timed = [(report["methods"]["evolve"]["time"] / max(report["ticks"], 1), run, report)
+             for (run, report) in zip(runs, profiles) if report]
+    for (per_tick, (point, replicate), report) in sorted(timed, key=lambda t: t[0], reverse=True)[:n]:
+        phases = ", ".join(name + " " + format(m["time"] / max(report["ticks"], 1) * 1000, ".2f")
+                           for (name, m) in report["methods"].items() if name in ["sense", "walk", "count"])
+        print("Slow run " + str(tuple(point.values()) + (replicate,)) + ": " + format(per_tick * 1000, ".2f") +
+              " ms/tick (" + phases + ")")
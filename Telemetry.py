@@ -0,0 +1,96 @@
+"""
+Progress of a sweep as a stream of JSON lines, to watch long experiments.
+Every finished run gives a "run" record with its parameter point, replicate,
+ticks, wall time, ticks per second and stop reason. Every `every` seconds, also
+while a long run is busy, a "progress" record is written by a background thread
+with the runs done, the throughput and the estimated time remaining. The stream goes to a file, or to a local socket
+given as tcp://host:port or unix:path, e.g. to follow a sweep with:
+
+nc -lk 9999 (and run with --telemetry tcp://localhost:9999)
+tail -f sweep.jsonl
+"""
+
+import json
+import socket
+import threading
+import time
+
+
+class Telemetry():
+    def __init__(self, target, every=10.):
+        self.every = every
+        self.total = 0
+        self.done = 0
+        self.ticks = 0
+        self.start = time.time()
+        # The runs done at the last progress record, to not repeat it when closing.
+        self.reported = None
+        self.lock = threading.Lock()
+
+        if target.startswith("tcp://"):
+            (host, port) = target[len("tcp://"):].rsplit(":", 1)
+            self.socket = socket.create_connection((host, int(port)))
+            self.stream = self.socket.makefile("w")
+        elif target.startswith("unix:"):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(target[len("unix:"):])
+            self.stream = self.socket.makefile("w")
+        else:
+            self.socket = None
+            self.stream = open(target, "a")
+
+        self.stopped = threading.Event()
+        self.timer = threading.Thread(target=self.__tick, daemon=True)
+        if every > 0:
+            self.timer.start()
+
+
+    def __tick(self):
+        while not self.stopped.wait(self.every):
+            self.progress()
+
+
+    def write(self, record):
+        with self.lock:
+            self.stream.write(json.dumps(dict(record, time=time.time())) + "\n")
+            self.stream.flush()
+
+
+    # Add runs to the number of runs the estimated time remaining is for.
+    def expect(self, runs):
+        self.total += runs
+
+
+    # Record a finished run. point holds its parameters, e.g. dict(food_sources=10, food_amount=18).
+    # The progress is recorded straight away once all expected runs are done.
+    def run(self, point, replicate, ticks, seconds, reason):
+        self.done += 1
+        self.ticks += ticks
+        self.write({"type": "run", "point": point, "replicate": replicate, "ticks": ticks, "seconds": seconds,
+                    "ticks_per_sec": ticks / seconds if seconds > 0 else None, "reason": reason})
+
+        if self.done == self.total:
+            self.progress()
+
+
+    # Record the runs done so far, the throughput since the start and the
+    # estimated time until the expected runs are done, in seconds.
+    def progress(self):
+        self.reported = self.done
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.
+        self.write({"type": "progress", "done": self.done, "total": self.total, "elapsed": elapsed,
+                    "runs_per_sec": rate, "ticks_per_sec": self.ticks / elapsed if elapsed > 0 else 0.,
+                    "eta": (self.total - self.done) / rate if rate > 0 else None})
+
+
+    # Stop the timer and record the final progress, unless nothing was done since the last record.
+    def close(self):
+        self.stopped.set()
+        if self.timer.is_alive():
+            self.timer.join()
+        if self.reported != self.done:
+            self.progress()
+        self.stream.close()
+        if self.socket:
+            self.socket.close()
@@ -0,0 +1,234 @@
+"""
+Engine for a single large colony, with the grid split in bands of rows
+that are each advanced by their own worker process. The arrays of
+NumpyAntsCA are kept in shared memory, so a worker reads the row on
+either side of its band (the halo) straight from the other bands.
+
+Within a band the rules are those of NumpyAntsCA. At the edges of the bands:
+- Sense: the workers copy their band and halo before any of them writes,
+  so every ant senses the grid as it was at the start of the phase.
+  Food taken from or brought to a cell of another band is added up once
+  all workers are done, and a food cell runs out when the total does.
+- Walk: an ant walking into another band moves after all bands have walked,
+  and only if the cell is empty then. If several ants walk into the same
+  cell, the first in scan order gets it and the others stay. The cell an
+  ant leaves this way stays blocked for its own band during the time step.
+- Every band draws random numbers from its own stream, so the results
+  depend on the number of tiles as well as on the seed.
+"""
+
+import os
+import weakref
+
+from multiprocessing import Barrier, Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from AntsCA import Cell
+from NumpyAntsCA import NumpyAntsCA, OPPOSITE, direction_offsets, evaporation, find_ants, sense, walk
+
+
+ARRAYS = ["state", "pher", "signal"]
+
+
+# First and last + 1 row of every band.
+def bands(N, tiles):
+    edges = np.linspace(0, N, tiles + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+# Attach to the arrays of the grid in shared memory.
+def attach(shared, N):
+    memory = [SharedMemory(name) for (name, _) in shared]
+    arrays = [np.ndarray((N, N), dtype, buffer=m.buf) for (m, (_, dtype)) in zip(memory, shared)]
+    return (memory, arrays)
+
+
+# Worker process that advances the rows lo to hi, on commands sent over conn.
+def tile_worker(conn, barrier, shared, N, lo, hi, seed, nest, init_signal, scale):
+    (memory, (state, pher, signal)) = attach(shared, N)
+    rng = np.random.default_rng(seed)
+
+    # The band with its halo, and the flat indices in it of the band and the halo.
+    top = max(lo - 1, 0)
+    bottom = min(hi + 1, N)
+    own = np.arange((lo - top) * N, (hi - top) * N)
+    halo = np.setdiff1d(np.arange((bottom - top) * N), own)
+
+    while True:
+        command = conn.recv()
+
+        if command[0] == "sense":
+            (ls, lp, lg) = [a[top:bottom].reshape(-1).copy() for a in (state, pher, signal)]
+            barrier.wait()
+
+            hstate = ls[halo]
+            hsignal = lg[halo].astype(np.int64)
+            ants = own[find_ants(ls[own])]
+            u = rng.random((2, len(ants)))
+            picked = sense(ls, lp, lg, N, np.array([nest - top * N]), ants, u, init_signal, top)
+
+            for (a, l) in zip((state, pher, signal), (ls, lp, lg)):
+                a[lo:hi] = l[own].reshape(hi - lo, N)
+
+            # Food taken from and brought to cells of the other bands.
+            delta = lg[halo] - hsignal
+            changed = ((hstate == Cell.FOOD) | (hstate == Cell.NEST)) & (delta != 0)
+            conn.send((picked, halo[changed] + top * N, delta[changed]))
+
+        elif command[0] == "walk":
+            (ls, lp, lg) = [a[lo:hi].reshape(-1) for a in (state, pher, signal)]
+            ants = find_ants(ls)
+            s = ls[ants]
+            target = ants + direction_offsets(N)[s]
+            crossing = (s != Cell.STAY) & ((target < 0) | (target >= len(ls)))
+
+            # Ants crossing to another band are walls while the band walks.
+            ls[ants[crossing]] = Cell.BORDER
+            inside = ants[~crossing]
+            moved = walk(ls, lp, lg, N, inside, command[1], init_signal, scale) != inside
+            ls[ants[crossing]] = s[crossing]
+            conn.send((int(np.count_nonzero(moved)), ants[crossing] + lo * N, target[crossing] + lo * N))
+
+        elif command[0] == "count":
+            ants = (state[lo:hi] >= Cell.NORTH) & (state[lo:hi] <= Cell.STAY)
+            conn.send((int(np.count_nonzero(ants)), int(np.count_nonzero(ants & (pher[lo:hi] > 0)))))
+
+        else:
+            break
+
+    del state, pher, signal
+    for m in memory:
+        m.close()
+
+
+# Stop the workers and free the shared memory. Worker processes started later
+# can hold a copy of the CA, which must not close it.
+def close_tiles(pid, conns, processes, memory):
+    if os.getpid() != pid:
+        return
+
+    for conn in conns:
+        try:
+            conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join()
+    for m in memory:
+        try:
+            m.close()
+        except BufferError:
+            pass
+        m.unlink()
+
+
+class TiledAntsCA(NumpyAntsCA):
+    # tiles is the number of bands and worker processes, by default one per core.
+    def __init__(self, food_sources=10, food_amount=10, N=50, ants_count=100, preset=None, seed=None, counter=None,
+                 cells="exact", tiles=None, scenario=None, config=None):
+        tiles = min(tiles or os.cpu_count(), N if scenario is None else len(scenario[0]))
+        (grid_seed, *self.tile_seeds) = np.random.SeedSequence(seed).spawn(tiles + 1)
+        super().__init__(food_sources, food_amount, N, ants_count, preset, grid_seed, counter, cells,
+                         scenario=scenario, config=config)
+        self.tiles = tiles
+
+        # Move the arrays to shared memory.
+        self.memory = []
+        for name in ARRAYS:
+            array = getattr(self, name)
+            m = SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, array.dtype, buffer=m.buf)
+            shared[:] = array
+            setattr(self, name, shared)
+            self.memory.append(m)
+
+        shared = [(m.name, getattr(self, name).dtype) for (m, name) in zip(self.memory, ARRAYS)]
+        (x, y) = self.NEST_COORD
+        barrier = Barrier(tiles)
+        self.conns = []
+        processes = []
+        for ((lo, hi), tile_seed) in zip(bands(self.N, tiles), self.tile_seeds):
+            (conn, worker_conn) = Pipe()
+            process = Process(target=tile_worker, daemon=True,
+                              args=(worker_conn, barrier, shared, self.N, lo, hi, tile_seed,
+                                    y * self.N + x, self.INIT_ANT_SIGNAL, self.pher_scale))
+            process.start()
+            self.conns.append(conn)
+            processes.append(process)
+
+        self.__finalizer = weakref.finalize(self, close_tiles, os.getpid(), self.conns, processes, self.memory)
+
+
+    # Stop the worker processes. The CA can not evolve after this.
+    def close(self):
+        self.__finalizer()
+
+
+    # Send a command to every worker and return their answers.
+    def __command(self, *command):
+        for conn in self.conns:
+            conn.send(command)
+        return [conn.recv() for conn in self.conns]
+
+
+    # Advance the CA one time step.
+    def evolve(self):
+        results = self.__command("sense")
+        self.picked_up = sum(r[0] for r in results)
+        self.__add_food(np.concatenate([r[1] for r in results]), np.concatenate([r[2] for r in results]))
+
+        results = self.__command("walk", evaporation(self.PHER_EVAPORATE, self.pher_scale))
+        self.moved = sum(r[0] for r in results)
+        self.moved += self.__cross(np.concatenate([r[1] for r in results]), np.concatenate([r[2] for r in results]))
+
+        results = self.__command("count")
+        self.stalled = sum(r[0] for r in results) - self.moved
+        (x, y) = self.NEST_COORD
+        self.FOOD_IN_NEST = int(self.signal[y, x])
+        self.counter.append([self.FOOD_IN_NEST, sum(r[1] for r in results)])
+        self.ticks += 1
+
+
+    # Add the food taken from and brought to cells by ants of other bands.
+    def __add_food(self, cells, delta):
+        (state, pher, signal) = [getattr(self, name).reshape(-1) for name in ARRAYS]
+        keep = (state[cells] == Cell.FOOD) | (state[cells] == Cell.NEST)
+        np.add.at(signal, cells[keep], delta[keep])
+
+        gone = cells[(state[cells] == Cell.FOOD) & (signal[cells] <= 0)]
+        state[gone] = Cell.EMPTY
+        pher[gone] = 0
+        signal[gone] = 0
+
+
+    # Move the ants that walk into another band, and return how many moved.
+    def __cross(self, ants, target):
+        (state, pher, signal) = [getattr(self, name).reshape(-1) for name in ARRAYS]
+        order = np.argsort(ants)
+        (ants, target) = (ants[order], target[order])
+
+        free = np.flatnonzero(state[target] == Cell.EMPTY)
+        _, first = np.unique(target[free], return_index=True)
+        winners = np.zeros(len(ants), dtype=bool)
+        winners[free[first]] = True
+
+        (a, t) = (ants[winners], target[winners])
+        s = state[a]
+        g = signal[a].astype(np.int64)
+        dpher = pher[t].astype(np.float64)
+        if self.pher_scale == 1.:
+            trail = g / self.INIT_ANT_SIGNAL
+        else:
+            trail = np.rint(g * self.pher_scale / self.INIT_ANT_SIGNAL)
+
+        state[a] = Cell.EMPTY
+        pher[a] = np.where(g > 0, trail, dpher)
+        signal[a] = 0
+        state[t] = OPPOSITE[s]
+        pher[t] = dpher
+        signal[t] = np.where(g > 1, g - 1, g)
+        state[ants[~winners]] = Cell.STAY
+
+        return len(a)
@@ -0,0 +1,130 @@
+"""
+Storage for the values counted every time step, such as AntsCA.counter.
+The rows are kept in a typed NumPy array that grows when it is full.
+Optionally only every k-th row is kept, only the last rows (a window),
+or the rows are streamed to a file in chunks, so the memory used stays
+the same however long a run is.
+"""
+
+import numpy as np
+
+
+class TimeSeries():
+    def __init__(self, columns, every=1, window=None, stream=None, chunk=4096, capacity=1024, dtype=np.int64):
+        self.columns = columns
+        self.every = every
+        self.window = window
+        self.chunk = chunk
+        self.dtype = dtype
+
+        # Number of rows appended, and kept in data or written to the stream.
+        self.count = 0
+        self.size = 0
+        self.written = 0
+        # Index in data of the oldest row of the window.
+        self.start = 0
+
+        # The path of the stream stays known once it is closed, to read the rows back.
+        self.path = stream
+        self.stream = open(stream, "wb") if stream else None
+        if window:
+            capacity = window
+        elif stream:
+            capacity = chunk
+        self.data = np.zeros((capacity, columns), dtype=dtype)
+
+
+    # Add the values of a time step. With every = k only the first
+    # of every k time steps is kept.
+    def append(self, row):
+        keep = self.count % self.every == 0
+        self.count += 1
+        if not keep:
+            return
+
+        if self.window:
+            self.data[(self.start + self.size) % self.window] = row
+            if self.size < self.window:
+                self.size += 1
+            else:
+                self.start = (self.start + 1) % self.window
+            return
+
+        if self.size == len(self.data):
+            if self.stream:
+                self.flush()
+            else:
+                data = np.zeros((2 * len(self.data), self.columns), dtype=self.dtype)
+                data[:self.size] = self.data
+                self.data = data
+
+        self.data[self.size] = row
+        self.size += 1
+
+
+    # Continue from the rows kept by an earlier series, to which count rows
+    # were appended, e.g. when a CA is restored from a snapshot.
+    def extend(self, rows, count):
+        every = self.every
+        self.every = 1
+        for row in rows:
+            self.append(row)
+        self.every = every
+        self.count = count
+
+
+    # Write the rows kept in memory to the stream.
+    def flush(self):
+        if self.stream and self.size:
+            self.data[:self.size].tofile(self.stream)
+            self.stream.flush()
+            self.written += self.size
+            self.size = 0
+
+
+    # Write the rows left to the stream and close it, e.g. when a run has finished.
+    # The rows can still be read, and the series can be sent to another process.
+    def close(self):
+        if self.stream:
+            self.flush()
+            self.stream.close()
+            self.stream = None
+
+
+    # All kept rows, oldest first. Streamed rows are read back from the file.
+    def array(self):
+        if self.window:
+            return np.roll(self.data[:self.size], -self.start, axis=0)
+
+        if self.path and self.written:
+            if self.stream:
+                self.stream.flush()
+            return np.concatenate([read_stream(self.path, self.columns, self.dtype), self.data[:self.size]])
+
+        return self.data[:self.size]
+
+
+    # The values of one column, e.g. the food in the nest for AntsCA.counter.
+    def column(self, i):
+        return self.array()[:, i]
+
+
+    def __len__(self):
+        return self.written + self.size
+
+
+    def __getitem__(self, i):
+        if i == -1 and self.size:
+            if self.window:
+                return self.data[(self.start + self.size - 1) % self.window]
+            return self.data[self.size - 1]
+        return self.array()[i]
+
+
+    def __iter__(self):
+        return iter(self.array())
+
+
+# Read the rows a TimeSeries streamed to a file.
+def read_stream(path, columns, dtype=np.int64):
+    return np.fromfile(path, dtype=dtype).reshape(-1, columns)
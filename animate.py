@@ -1,29 +1,16 @@
-from AntsCA import Cell, AntsCA
+from AntsCA import AntsCA
+from render import newcmp, frame
 
-import numpy as np
 import argparse
 import matplotlib.pyplot as plt
 from matplotlib import animation
-from matplotlib import colors
-from matplotlib import cm
 
 
-
-# Really hacky but mixing qualitative & quantitative color maps is annoying.
-viridis = cm.get_cmap('Greys', 100)
-newcolors = viridis(np.linspace(0, 1, 100))
-newcolors[0:5] = [0.00,1.00,0.16,1]
-newcolors[6:55] = [0.60,0.20,0.00,1]
-newcolors[56:65] = [0,0,0,1]
-newcolors[66:75] = [1.00,1.00,0.10,1]
-newcolors[76:100] = viridis(np.linspace(0, 1, 48)[0:24])
-newcmp = colors.ListedColormap(newcolors)
-
 # Advance one time step and draw the CA using a mapping.
 def animate(i):
     im.set_data(animate.map)
     ants.evolve()
-    animate.map = [[c[0].value / 10. + (c[1]/5. if c[0] == Cell.EMPTY else 0) for c in b] for b in ants.grid]
+    animate.map = frame(ants)
 
 if __name__== "__main__":
     parser = argparse.ArgumentParser()
@@ -37,7 +24,7 @@ if __name__== "__main__":
         ants = AntsCA()
 
     # implement the first color mapping of the grid.
-    mapping = [[c[0].value / 10. + (c[1]/5. if c[0] == Cell.EMPTY else 0) for c in b] for b in ants.grid]
+    mapping = frame(ants)
 
     # Plot animation.
     fig = plt.figure(figsize=(25/3, 6.25))
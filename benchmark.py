@@ -0,0 +1,159 @@
+"""
+Benchmark of the CA engines over grid sizes, ant counts and food layouts.
+Every case is run with a fixed seed, and the ticks per second, the time spent
+in sense, walk and count and the peak memory are saved as JSON.
+Compare with an earlier run to find regressions:
+
+python3 benchmark.py --out bench.json
+python3 benchmark.py --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from food import inputs, engines
+
+
+# Grid sizes, ant counts and food layouts (number of sources, amount per source) of the full matrix.
+SIZES = [50, 200, 1000]
+ANTS = [100, 1000]
+LAYOUTS = [inputs[0], inputs[5], inputs[-1]]
+
+# The smaller matrix of --quick.
+QUICK_SIZES = [50, 200]
+QUICK_ANTS = [100]
+QUICK_LAYOUTS = [inputs[0], inputs[-1]]
+
+PRESET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input1.txt")
+PHASES = ["sense", "walk", "count"]
+
+
+# The cases of the matrix, leaving out grids too small for the ants and food.
+def cases(sizes, ants, layouts, seed):
+    cases = [{"name": "preset", "preset": PRESET, "seed": seed}]
+    for N in sizes:
+        for ants_count in ants:
+            for (sources, amount) in layouts:
+                if ants_count + sources > (N - 2) ** 2 - 1:
+                    continue
+                cases.append({"name": "N=%d ants=%d food=%dx%d" % (N, ants_count, sources, amount),
+                              "N": N, "ants_count": ants_count, "food_sources": sources,
+                              "food_amount": amount, "seed": seed})
+    return cases
+
+
+def make(engine, case):
+    if case.get("preset"):
+        return engine(preset=case["preset"], seed=case["seed"])
+    return engine(food_sources=case["food_sources"], food_amount=case["food_amount"],
+                  N=case["N"], ants_count=case["ants_count"], seed=case["seed"])
+
+
+# The phases of evolve, so they can be timed one by one.
+# TiledAntsCA runs the phases in its workers, so only evolve is timed.
+def phases(ca):
+    prefix = "_" + type(ca).__name__ + "__"
+    if not hasattr(ca, prefix + PHASES[0]):
+        return {"evolve": ca.evolve}
+    return {phase: getattr(ca, prefix + phase) for phase in PHASES}
+
+
+# Time ticks time steps after warmup untimed ones. The peak memory is measured in a
+# separate run of the setup and the warmup, as tracing the allocations slows it down.
+# Only the memory of this process is traced, not that of worker processes.
+def bench(engine, case, ticks, warmup):
+    ca = make(engine, case)
+    for _ in range(warmup):
+        ca.evolve()
+
+    times = dict.fromkeys(phases(ca), 0.)
+    for _ in range(ticks):
+        for (name, phase) in phases(ca).items():
+            start = time.perf_counter()
+            phase()
+            times[name] += time.perf_counter() - start
+
+    tracemalloc.start()
+    ca = make(engine, case)
+    for _ in range(max(warmup, 1)):
+        ca.evolve()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(times.values())
+    return dict(case, ticks=ticks, ticks_per_sec=ticks / total if total else 0.,
+                phases=times, peak_memory=peak)
+
+
+# Compare the results with a baseline, and return the regressions of more than tolerance:
+# fewer ticks per second, more time in a phase or a higher peak memory.
+# Phases that took less than MIN_SHARE of the time per tick are too noisy to compare.
+MIN_SHARE = .05
+
+def regressions(results, baseline, tolerance):
+    found = []
+    old = {case["name"]: case for case in baseline["cases"]}
+    for case in results["cases"]:
+        if case["name"] not in old:
+            continue
+        base = old[case["name"]]
+        slower = lambda new, old: old > 0 and new > old * (1 + tolerance)
+
+        if case["ticks_per_sec"] < base["ticks_per_sec"] * (1 - tolerance):
+            found.append((case["name"], "ticks/sec", base["ticks_per_sec"], case["ticks_per_sec"]))
+        for phase in case["phases"].keys() & base["phases"].keys():
+            if base["phases"][phase] < MIN_SHARE * sum(base["phases"].values()):
+                continue
+            if slower(case["phases"][phase] / case["ticks"], base["phases"][phase] / base["ticks"]):
+                found.append((case["name"], phase + " s/tick", base["phases"][phase] / base["ticks"],
+                              case["phases"][phase] / case["ticks"]))
+        if slower(case["peak_memory"], base["peak_memory"]):
+            found.append((case["name"], "peak memory", base["peak_memory"], case["peak_memory"]))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CA engines.")
+    parser.add_argument('--engine', choices=[e for e in engines if e != 'ensemble'], default='python')
+    parser.add_argument('--quick', action='store_true', help="run a smaller matrix")
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="save the results as JSON")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--tolerance', type=float, default=.2)
+    args = parser.parse_args()
+
+    if args.quick:
+        matrix = cases(QUICK_SIZES, QUICK_ANTS, QUICK_LAYOUTS, args.seed)
+    else:
+        matrix = cases(SIZES, ANTS, LAYOUTS, args.seed)
+
+    results = {"engine": args.engine, "python": sys.version.split()[0],
+               "machine": platform.platform(), "cases": []}
+    for case in matrix:
+        result = bench(engines[args.engine], case, args.ticks, args.warmup)
+        results["cases"].append(result)
+        print("%-32s %10.1f ticks/sec %10.1f MB" % (case["name"], result["ticks_per_sec"],
+                                                     result["peak_memory"] / 2**20))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["engine"] != args.engine:
+            print("The baseline was made with the " + baseline["engine"] + " engine.")
+        found = regressions(results, baseline, args.tolerance)
+        for (name, what, old, new) in found:
+            print("REGRESSION %s: %s %.4g -> %.4g" % (name, what, old, new))
+        if found:
+            exit(1)
+        print("No regressions against " + args.baseline)
@@ -3,11 +3,20 @@ Script to generate the food-related graphs from the poster.
 """
 
 import argparse
+import json
+import os
 import pickle
 import matplotlib.pyplot as plt
 import numpy as np
 
+from functools import partial
 from AntsCA import AntsCA, Cell
+from NumpyAntsCA import NumpyAntsCA, EnsembleAntsCA
+from TiledAntsCA import TiledAntsCA
+from RunCache import RunCache, describe
+from Sweep import Sweep, experiment_seed, run_all
+from Telemetry import Telemetry
+from results import SERIES, Results, check_target, load_results
 
 from mpl_toolkits import mplot3d
 
@@ -30,61 +39,227 @@ inputs = [
     (180, 1)
 ]
 
-def experiment3d(filename, n, ants):
+# The engines that can run the CA.
+engines = {
+    'python': AntsCA,
+    'sparse': partial(AntsCA, sparse=True, lazy=True),
+    'jit': partial(AntsCA, jit=True),
+    'numpy': NumpyAntsCA,
+    'numpy32': partial(NumpyAntsCA, cells="float32"),
+    'numpy16': partial(NumpyAntsCA, cells="fixed16"),
+    'ensemble': EnsembleAntsCA,
+    'tiled': TiledAntsCA
+}
+
+# The runs of (sources, amount, replicate) as (point, replicate) runs of a Sweep.
+def food_runs(runs):
+    return [({"food_sources": sources, "food_amount": amount}, replicate) for (sources, amount, replicate) in runs]
+
+
+# Two-sided 95% quantiles of Student's t distribution for 1 to 29 degrees of freedom,
+# and of the normal distribution for more, used for the confidence interval of the
+# mean iterations of a point.
+T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045]
+Z95 = 1.96
+
+def t95(df):
+    return T95[df - 1] if df <= len(T95) else Z95
+
+
+# The number of replicates a point needs, from the iterations of its runs so far:
+# enough for a 95% confidence interval of the mean at most ci_width wide, but at
+# most max_n. The spread is only an estimate with few runs, so the count at most
+# doubles per round. Without ci_width every point gets exactly n replicates.
+def replicates_needed(iterations, n, ci_width=None, max_n=100):
+    k = len(iterations)
+    if ci_width is None or k < n:
+        return max(k, n)
+    if k < 2:
+        return min(2, max_n)
+
+    spread = 2 * t95(k - 1) * np.std(iterations, ddof=1)
+    if spread / np.sqrt(k) <= ci_width:
+        return k
+    needed = int(np.ceil((spread / ci_width) ** 2))
+    return max(k, min(needed, 2 * k, max_n))
+
+
+# Run replicates of every (sources, amount) point in rounds, until each point has the
+# replicates it needs, see replicates_needed. run_round(runs) runs a list of
+# (sources, amount, replicate) and returns their iterations.
+# Returns the number of replicates of every point.
+def replicate_points(run_round, points, n, ci_width=None, max_n=100):
+    iterations = {point: [] for point in points}
+    while True:
+        runs = [(sources, amount, r) for (sources, amount) in points
+                for r in range(len(iterations[(sources, amount)]),
+                               replicates_needed(iterations[(sources, amount)], n, ci_width, max_n))]
+        if not runs:
+            break
+        for ((sources, amount, _), its) in zip(runs, run_round(runs)):
+            iterations[(sources, amount)].append(its)
+
+    counts = {point: len(its) for (point, its) in iterations.items()}
+    if ci_width is not None:
+        print("Replicates per point: " + str(min(counts.values())) + " to " + str(max(counts.values())) +
+              ", " + str(sum(counts.values())) + " runs")
+    return counts
+
+
+# Read the journal of an experiment. The first line holds the settings of the experiment,
+# every other line a finished run. A line cut off by a crash is skipped.
+def read_journal(path):
+    settings = None
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if settings is None:
+                settings = record
+            else:
+                runs[(record["sources"], record["amount"], record["replicate"])] = record
+
+    return (settings, runs)
+
+
+# Start a new journal, or continue the existing one when resuming.
+# An existing journal is never started over, as that would lose its runs.
+# settings holds everything the runs depend on besides the seed, such as the engine,
+# the stop conditions and the replicates, and must be the same to resume.
+# Returns the seed to use, which is the seed of the journal when resuming.
+def open_journal(path, seed, settings, resume):
+    # The settings as they are read back from the journal.
+    settings = json.loads(json.dumps(settings))
+    if resume and os.path.exists(path):
+        (journal, _) = read_journal(path)
+        if (seed is not None and seed != journal["seed"]) or \
+                any(journal.get(name) != value for (name, value) in settings.items()):
+            print("The settings do not match the journal " + path + ": " + str(journal))
+            exit(1)
+        print("Resuming from " + path)
+
+        # Start on a new line if the last line was cut off.
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+        return journal["seed"]
+
+    if os.path.exists(path):
+        print("The journal " + path + " already exists. Pass --resume to continue it, or remove it to start over.")
+        exit(1)
+
+    seed = experiment_seed(seed)
+    with open(path, "w") as f:
+        f.write(json.dumps(dict(settings, seed=seed)) + "\n")
+    return seed
+
+
+# With ci_width, every point starts with n replicates and gets more until the confidence
+# interval of its mean iterations is at most ci_width wide or it has max_n replicates.
+# The number of replicates of every point is saved after the mean iterations.
+def experiment3d(filename, n, ants, engine=AntsCA, workers=1, seed=None, resume=False, stop=None, profile=False,
+                 ci_width=None, max_n=100, telemetry=None, cache=None):
     src = np.arange(10, 110, 10)
     amt = np.arange(10, 110, 10)
-    srcv, amtv = np.meshgrid(src, amt)
-    meanIts = np.copy(srcv)
-    count = 1
+
+    # Every finished run is written to the journal straight away,
+    # so an interrupted experiment can be resumed with only the missing runs.
+    journal = filename[0] + ".journal"
+    settings = {"ants": ants, "engine": describe(engine), "stop": stop or {}, "n": n, "ci_width": ci_width,
+                "max_n": max_n}
+    seed = open_journal(journal, seed, settings, resume)
+    (_, done) = read_journal(journal)
 
     print("Points to calc: " + str(len(src) * len(amt)))
 
-    for i in range(len(src)):
-        for j in range(len(amt)):
-            print()
-            print("Point nr: " + str(count))
-            it_it = []
-            for time in range(n):
-                print("n: " + str(time + 1))
-                ca = AntsCA(food_sources=src[i], food_amount=amt[j], ants_count=ants)
-                (nestx, nesty) = ca.NEST_COORD
-
-                while True:
-                    ca.evolve()
-                    food = ca.grid[nesty][nestx][2]
-                    if food >= src[i] * amt[j]:
-                        break
-                it_it.append(len(ca.counter))
-            count += 1
-
-            meanIts[j][i] = int(np.mean(it_it))
-
-    pickle.dump((srcv, amtv, meanIts), open(filename[0], "wb"))
-
-
-def experiment(filename, n, ants):
-    results = {}
-    count = 0
-    for (sources, amount) in inputs:
-        results[(sources, amount)] = []
-        for _ in range(n):
-            ca = AntsCA(food_sources=sources, food_amount=amount, ants_count=ants)
-            (nestx, nesty) = ca.NEST_COORD
-            while True:
-                ca.evolve()
-                food = ca.grid[nesty][nestx][2]
-                if food >= sources * amount:
-                    break
-            food = [i[0] for i in ca.counter]
-            on_pher = [i[1] for i in ca.counter]
-            results[(sources, amount)].append((food, on_pher))
-            count += 1
-            print(count)
-
-    pickle.dump(results, open(filename[0], "wb"))
+    points = [(int(sources), int(amount)) for sources in src for amount in amt]
+
+    with open(journal, "a") as f:
+        def finished(run, counter, reason, report):
+            (point, replicate) = run
+            (sources, amount) = (point["food_sources"], point["food_amount"])
+            (food, on_pher) = counter[-1][:2]
+            record = {"sources": sources, "amount": amount, "replicate": replicate,
+                      "iterations": counter.count, "food": int(food), "on_pher": int(on_pher), "reason": reason}
+            if report:
+                record["profile"] = report
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            done[(sources, amount, replicate)] = record
+
+        def run_round(runs):
+            todo = [run for run in runs if run not in done]
+            print("Runs done before: " + str(len(runs) - len(todo)))
+            # Only the number of iterations is used, so the counters only keep their last row.
+            run_all(engine, food_runs(todo), seed, workers, finished, stop, profile, dict(window=1), telemetry,
+                    {"ants_count": ants}, cache)
+            return [done[run]["iterations"] for run in runs]
+
+        counts = replicate_points(run_round, points, n, ci_width, max_n)
+
+    # The runs are stored like those of experiment, with only the last row of their time series
+    # and the number of iterations of every run.
+    runs = [(sources, amount, r) for (sources, amount) in points for r in range(counts[(sources, amount)])]
+    records = [done[run] for run in runs]
+    Results(np.array(runs, dtype=np.int64), np.arange(len(runs) + 1, dtype=np.int64),
+            {name: np.array([record.get(name, 0) for record in records], dtype=np.int32) for name in SERIES},
+            np.array([record.get("reason", "") for record in records], dtype=str),
+            {"food_sources": np.array([sources for (sources, _, _) in runs]),
+             "food_amount": np.array([amount for (_, amount, _) in runs]),
+             "ants_count": np.full(len(runs), ants)},
+            np.array([record["iterations"] for record in records], dtype=np.int64)).save(filename[0])
+
+
+# See experiment3d for ci_width and max_n. The number of replicates of every point
+# is that of its runs in the results.
+def experiment(filename, n, ants, engine=AntsCA, workers=1, seed=None, stop=None, profile=False,
+               ci_width=None, max_n=100, telemetry=None, cache=None):
+    seed = experiment_seed(seed)
+    found = {}
+
+    def run_round(runs):
+        (counters, reasons, profiles) = run_all(engine, food_runs(runs), seed, workers, stop=stop, profile=profile,
+                                                telemetry=telemetry, fixed={"ants_count": ants}, cache=cache)
+        found.update(zip(runs, zip(counters, reasons, profiles)))
+        return [counter.count for counter in counters]
+
+    counts = replicate_points(run_round, inputs, n, ci_width, max_n)
+    runs = [(sources, amount, r) for (sources, amount) in inputs for r in range(counts[(sources, amount)])]
+    (counters, reasons, profiles) = zip(*[found[run] for run in runs])
+
+    # The runs are stored grouped by (sources, amount), in the order of inputs like runs.
+    Results.from_runs(food_runs(runs), counters, reasons, {"ants_count": ants}).save(filename[0])
+
+    if profile:
+        with open(filename[0] + ".profile.json", "w") as f:
+            json.dump([dict(report, sources=sources, amount=amount, replicate=replicate)
+                       for ((sources, amount, replicate), report) in zip(runs, profiles) if report], f)
 
 def graph3d(filename):
-    X, Y, Z = pickle.load(open(filename[0], "rb"))
+    if os.path.isdir(filename[0]):
+        # The mean iterations of every (sources, amount) point of the results.
+        results = load_results(filename[0])
+        keys = results.keys()
+        src = sorted({sources for (sources, _) in keys})
+        amt = sorted({amount for (_, amount) in keys})
+        X, Y = np.meshgrid(src, amt)
+        Z = np.zeros_like(X)
+        for (sources, amount) in keys:
+            Z[amt.index(amount)][src.index(sources)] = int(np.mean(results.lengths((sources, amount))))
+    else:
+        # Results pickled by an earlier version also hold the number of replicates of every point.
+        X, Y, Z = pickle.load(open(filename[0], "rb"))[:3]
 
     plt.figure()
     ax = plt.axes(projection ='3d')
@@ -103,13 +278,13 @@ def graph3d(filename):
 
 
 def graph(filename):
-    # Structure of results is a dictionary with keys (number of sources, amount per source)
-    # and value a list with each run.
-    # Each list item contains (food per iteration, ants on pheromones trail)
-    results = pickle.load(open(filename[0], "rb"))
+    # The results hold for each key (number of sources, amount per source) a number of runs,
+    # each with the time series food per iteration and ants on pheromones trail.
+    results = load_results(filename[0])
     plt.figure(figsize=(15,5))
-    for key, value in results.items():
-        plt.plot(np.arange(len(value[0][0])), value[0][0], label=key)
+    for key in results.keys():
+        food = results.get("food", results.runs_of(key)[0])
+        plt.plot(np.arange(len(food)), food, label=str(key))
     plt.xlabel('Iterations')
     plt.ylabel('Food')
     plt.title('Food distribution')
@@ -120,13 +295,10 @@ def graph(filename):
     plt.figure(figsize=(15,5))
     means = []
     stds = []
-    food = []
-    keys = []
-    for key, value in results.items():
-        food.append([i[0] for i in value])
-        keys.append(key)
-        means.append(np.mean([len(i[0]) for i in value]))
-        stds.append(np.std([len(i[0]) for i in value]))
+    keys = results.keys()
+    for key in keys:
+        means.append(np.mean(results.lengths(key)))
+        stds.append(np.std(results.lengths(key)))
 
     plt.bar(list(map(str,keys)), means, yerr=stds, align="center", label=key)
     plt.xlabel('Iterations')
@@ -139,16 +311,13 @@ def multiple_bar(filenames):
     plt.figure(figsize=(15,5))
     ind = np.arange(12)
     for f, barwidth, label, color in zip(filenames, [-0.2, 0, 0.2], [50, 100, 150], ['blue','orange', 'green']):
-        results = pickle.load(open(f, "rb"))
+        results = load_results(f)
         means = []
         stds = []
-        food = []
-        keys = []
-        for key, value in results.items():
-            food.append([i[0] for i in value])
-            keys.append(key)
-            means.append(np.mean([len(i[0]) for i in value]))
-            stds.append(np.std([len(i[0]) for i in value]))
+        keys = results.keys()
+        for key in keys:
+            means.append(np.mean(results.lengths(key)))
+            stds.append(np.std(results.lengths(key)))
 
         plt.bar(ind+barwidth, means, width=0.2, yerr=stds, align="center", label=label, color=color)
 
@@ -168,22 +337,63 @@ if __name__ == "__main__":
     parser.add_argument('--graph', action='store_true')
     parser.add_argument('--graph3d', action='store_true')
     parser.add_argument('--multi', action='store_true')
-    parser.add_argument('--file', nargs="+", default='food_results.p')
+    parser.add_argument('--sweep', help="run the sweep of a JSON file, see Sweep.py, and save its results in --file")
+    parser.add_argument('--file', nargs="+", default=['food_results.p'])
     parser.add_argument('--n', type=int, default=1)
     parser.add_argument('--ants', type=int, default=100)
+    parser.add_argument('--engine', choices=list(engines), default='python')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--max-ticks', type=int)
+    parser.add_argument('--stall-ticks', type=int)
+    parser.add_argument('--target', type=float, default=1.)
+    parser.add_argument('--detect-repeats', action='store_true')
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--ci-width', type=float,
+                        help="add replicates to a point until the 95%% confidence interval of its mean "
+                             "iterations is at most this wide, starting from --n")
+    parser.add_argument('--max-n', type=int, default=100, help="most replicates of a point with --ci-width")
+    parser.add_argument('--telemetry', help="write the progress as JSON lines to a file, tcp://host:port or unix:path")
+    parser.add_argument('--telemetry-every', type=float, default=10., help="seconds between progress records")
+    parser.add_argument('--cache', help="directory of finished runs to reuse, see RunCache.py")
+    parser.add_argument('--cache-size', type=float, default=1024., help="most megabytes kept in --cache")
     args = parser.parse_args()
 
-    if not (args.experiment ^ args.graph ^ args.experiment3d ^ args.graph3d ^ args.multi):
-        print("Choose either --experiment(3d), --graph(3d) or --multi.")
+    stop = dict(max_ticks=args.max_ticks, stall_ticks=args.stall_ticks, target=args.target)
+    if args.detect_repeats:
+        stop["detect_repeats"] = True
+
+    if not (args.experiment ^ args.graph ^ args.experiment3d ^ args.graph3d ^ args.multi ^ bool(args.sweep)):
+        print("Choose either --experiment(3d), --graph(3d), --multi or --sweep.")
         exit(1)
 
+    # The results are only saved once all runs have finished, so check where they go first.
+    if args.experiment or args.experiment3d or args.sweep:
+        try:
+            check_target(args.file[0])
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+    telemetry = Telemetry(args.telemetry, args.telemetry_every) if args.telemetry else None
+    cache = RunCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+
     if args.experiment:
-        experiment(args.file, args.n, args.ants)
+        experiment(args.file, args.n, args.ants, engines[args.engine], args.workers, args.seed, stop, args.profile,
+                   args.ci_width, args.max_n, telemetry, cache)
     elif args.experiment3d:
-        experiment3d(args.file, args.n, args.ants)
+        experiment3d(args.file, args.n, args.ants, engines[args.engine], args.workers, args.seed, args.resume, stop,
+                     args.profile, args.ci_width, args.max_n, telemetry, cache)
+    elif args.sweep:
+        Sweep.from_json(args.sweep).run(engines[args.engine], args.seed, args.workers, stop, telemetry=telemetry,
+                                        path=args.file[0], cache=cache)
     elif args.graph:
         graph(args.file)
     elif args.multi:
         multiple_bar(args.file)
     else:
-        graph3d(args.file)
\ No newline at end of file
+        graph3d(args.file)
+
+    if telemetry:
+        telemetry.close()
\ No newline at end of file
@@ -2,32 +2,26 @@
 Script to visualise the Ants CA.
 """
 
-from AntsCA import Cell, AntsCA
+from AntsCA import AntsCA
+from render import newcmp, frame
+from food import engines
+from results import load_results
+from RunCache import RunCache
+from Sweep import Sweep
+from Telemetry import Telemetry
 
 import argparse
 import matplotlib.pyplot as plt
 from matplotlib import animation
-from matplotlib import colors
-from matplotlib import cm
 
 import numpy as np
 
 
-# Really hacky but mixing qualitative & quantitative color maps is annoying.
-viridis = cm.get_cmap('Greys', 100)
-newcolors = viridis(np.linspace(0, 1, 100))
-newcolors[0:5] = [0.00,1.00,0.16,1]
-newcolors[6:55] = [0.60,0.20,0.00,1]
-newcolors[56:65] = [0,0,0,1]
-newcolors[66:75] = [1.00,1.00,0.10,1]
-newcolors[76:100] = viridis(np.linspace(0, 1, 48)[0:24])
-newcmp = colors.ListedColormap(newcolors)
-
 # Advance one time step and draw the CA.
 def animate(i):
     im.set_data(animate.map)
     ants.evolve()
-    animate.map = [[c[0].value / 10. + (c[1]/5. if c[0] == Cell.EMPTY else 0) for c in b] for b in ants.grid]
+    animate.map = frame(ants)
 
 def graph_food_time(iteration, food):
     # Plot the amount of food over iterations.
@@ -49,21 +43,29 @@ def graph_on_pher_time(iteration, on_pher):
     plt.title("Amount of ants on a pheromone trail over time.")
     plt.show()
 
-def graph_ants_evap_iterate(all_pher):
+def graph_ants_evap_iterate(results):
     plt.figure(figsize=(15,5))
-    for p in all_pher:
-        plt.plot(np.arange(len(p)), p)
+    for (evaporate, runs) in results.groups("PHER_EVAPORATE"):
+        # The mean over the runs of an evaporation rate, up to the end of the shortest run.
+        on_pher = [results.get("on_pher", run) for run in runs]
+        p = np.mean([s[:min(map(len, on_pher))] for s in on_pher], axis=0)
+        plt.plot(np.arange(len(p)), p, label=str(evaporate))
     plt.xlabel('Iterations')
     plt.ylabel('Ants on pheromone trail')
     plt.title('Mean of ants on pheromone trail per iteration')
+    plt.legend()
     plt.show()
 
-def graphs_iteration_per_evap(it_needed):
-    std_len = np.std(it_needed)
-    mean_len = np.mean(it_needed)
-    it_vals.append(mean_len)
-    it_vals_lower.append(mean_len - std_len)
-    it_vals_upper.append(mean_len + std_len)
+# The evaporation rates of the results, and the mean iterations of their runs minus and plus one std.
+def iterations_per_evap(results):
+    groups = results.groups("PHER_EVAPORATE")
+    it_needed = [results.run_lengths()[runs] for (_, runs) in groups]
+    it_vals = np.array([np.mean(its) for its in it_needed])
+    std_len = np.array([np.std(its) for its in it_needed])
+    return ([evaporate for (evaporate, _) in groups], it_vals, it_vals - std_len, it_vals + std_len)
+
+def graphs_iteration_per_evap(results):
+    (evap_rate_vals, it_vals, it_vals_lower, it_vals_upper) = iterations_per_evap(results)
 
     plt.figure(figsize=(15,5))
 
@@ -74,12 +76,8 @@ def graphs_iteration_per_evap(it_needed):
     plt.ylabel('Iterations')
     plt.show()
 
-def graphs_iteration_per_evap_diff(it_needed):
-    std_len = np.std(it_needed)
-    mean_len = np.mean(it_needed)
-    it_vals.append(mean_len)
-    it_vals_lower.append(mean_len - std_len)
-    it_vals_upper.append(mean_len + std_len)
+def graphs_iteration_per_evap_diff(results):
+    (evap_rate_vals, it_vals, it_vals_lower, it_vals_upper) = iterations_per_evap(results)
 
     plt.figure(figsize=(15,5))
 
@@ -95,6 +93,21 @@ if __name__== "__main__":
     parser.add_argument('--preset')
     parser.add_argument('--no-graphs', action='store_true')
     parser.add_argument('--animate', action='store_true')
+    parser.add_argument('--max-ticks', type=int)
+    parser.add_argument('--stall-ticks', type=int)
+    parser.add_argument('--engine', choices=list(engines), default='python')
+    parser.add_argument('--evaporate', type=float, nargs="+", default=[0.001, 0.0099],
+                        help="the evaporation rates of the sweep")
+    parser.add_argument('--replicates', type=int, default=3, help="runs per evaporation rate")
+    parser.add_argument('--sweep', help="run the sweep of a JSON file over PHER_EVAPORATE instead, see Sweep.py")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--save', help="save the results of the evaporation sweep in this directory")
+    parser.add_argument('--load', help="plot the results of an earlier evaporation sweep instead")
+    parser.add_argument('--cache', help="directory of finished runs to reuse, see RunCache.py")
+    parser.add_argument('--cache-size', type=float, default=1024., help="most megabytes kept in --cache")
+    parser.add_argument('--telemetry', help="write the progress as JSON lines to a file, tcp://host:port or unix:path")
+    parser.add_argument('--telemetry-every', type=float, default=10., help="seconds between progress records")
     args = parser.parse_args()
 
     N = 50
@@ -104,7 +117,7 @@ if __name__== "__main__":
         ants = AntsCA(N=N)
 
     if args.animate:
-        mapping = [[c[0].value / 10. + (c[1]/5. if c[0] == Cell.EMPTY else 0) for c in b] for b in ants.grid]
+        mapping = frame(ants)
 
         fig = plt.figure(figsize=(25/3, 6.25))
         ax = fig.add_subplot(111)
@@ -126,38 +139,21 @@ if __name__== "__main__":
             graph_on_pher_time(iteration, on_pher)
 
     else:
-        all_variables = []
-        all_pher = []
-        it_vals = []
-        it_vals_lower = []
-        it_vals_upper = []
-        # if we want to look at the mean of food or something we need to change range to higher.
-        evap_rate_vals = np.linspace(0.001, 0.0099, 2)
-
-        for e in evap_rate_vals:
-            for j in range(3):
-                ants = AntsCA(N)
-                ants.PHER_EVAPORATE = e
-                while True:
-                    ants.evolve()
-                    (cx, cy) = ants.NEST_COORD
-                    food = ants.grid[cy][cx][2]
-                    if food == ants.INIT_FOOD_PER_SPOT * ants.INIT_N_FOOD:
-                        break
-
-                food = [i[0] for i in ants.counter]
-                on_pher = [i[1] for i in ants.counter]
-
-                all_variables.append([food, on_pher])
-                print('#################')
-                print(j)
-                print('#################')
-
-            it_needed = [len(i[1]) for i in all_variables]
-
-            pher_list = np.asarray([i[1][:min(it_needed)] for i in all_variables]).mean(axis=0)
-            all_pher.append(pher_list)
+        if args.load:
+            results = load_results(args.load)
+        else:
+            telemetry = Telemetry(args.telemetry, args.telemetry_every) if args.telemetry else None
+            cache = RunCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+            if args.sweep:
+                sweep = Sweep.from_json(args.sweep)
+            else:
+                sweep = Sweep({"PHER_EVAPORATE": args.evaporate}, replicates=args.replicates, fixed={"N": N})
+            results = sweep.run(engines[args.engine], args.seed, args.workers,
+                                dict(max_ticks=args.max_ticks, stall_ticks=args.stall_ticks),
+                                telemetry=telemetry, path=args.save, cache=cache)
+            if telemetry:
+                telemetry.close()
 
         if not args.no_graphs:
-            graph_ants_evap_iterate(all_pher)
-            graphs_iteration_per_evap(it_needed)
\ No newline at end of file
+            graph_ants_evap_iterate(results)
+            graphs_iteration_per_evap(results)
@@ -0,0 +1,144 @@
+"""
+Render the Ants CA without a window, to PNG images or a video.
+The colours of a frame are computed from the whole grid at once,
+with the colormap that animate.py and graphs.py also use.
+
+python3 render.py --ticks 1000 --every 10 --out frames
+python3 render.py --ticks 1000 --every 10 --video ants.mp4 (needs ffmpeg)
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+
+from itertools import chain
+
+import numpy as np
+from matplotlib import colormaps, colors, image
+
+from AntsCA import Cell
+
+
+# Really hacky but mixing qualitative & quantitative color maps is annoying.
+viridis = colormaps['Greys'].resampled(100)
+newcolors = viridis(np.linspace(0, 1, 100))
+newcolors[0:5] = [0.00,1.00,0.16,1]
+newcolors[6:55] = [0.60,0.20,0.00,1]
+newcolors[56:65] = [0,0,0,1]
+newcolors[66:75] = [1.00,1.00,0.10,1]
+newcolors[76:100] = viridis(np.linspace(0, 1, 48)[0:24])
+newcmp = colors.ListedColormap(newcolors)
+
+
+# The state and pheromones of every cell as arrays.
+# The grid of AntsCA is converted in one go instead of cell by cell.
+def grid_arrays(ca):
+    if isinstance(getattr(ca, "state", None), np.ndarray):
+        return (ca.state, ca.pheromones())
+
+    ca.sync_pheromones()
+    cells = chain.from_iterable(chain.from_iterable(ca.grid))
+    cells = np.fromiter(cells, np.float64, count=3 * ca.N * ca.N).reshape(ca.N, ca.N, 3)
+    return (cells[:, :, 0], cells[:, :, 1])
+
+
+# Value of every cell in newcmp: the state, and the pheromones on empty cells.
+def frame(ca):
+    (state, pher) = grid_arrays(ca)
+    return state / 10. + np.where(state == Cell.EMPTY, pher / 5., 0.)
+
+
+# RGB pixels of a frame, with scale x scale pixels per cell.
+def pixels(values, scale=1):
+    rgb = newcmp(np.clip(values, 0, 1), bytes=True)[:, :, :3]
+    return np.repeat(np.repeat(rgb, scale, axis=0), scale, axis=1)
+
+
+# Writes every frame to a numbered PNG file in a directory.
+class PNGWriter():
+    def __init__(self, directory):
+        self.directory = directory
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    def write(self, rgb):
+        image.imsave(os.path.join(self.directory, "frame_%06d.png" % self.frames), rgb)
+        self.frames += 1
+
+
+    def close(self):
+        pass
+
+
+# Pipes the frames to ffmpeg, which encodes them in a video file.
+class VideoWriter():
+    def __init__(self, filename, fps=30):
+        self.filename = filename
+        self.fps = fps
+        self.process = None
+
+
+    def write(self, rgb):
+        if self.process is None:
+            (height, width, _) = rgb.shape
+            # Most codecs need an even width and height.
+            self.process = subprocess.Popen(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                 "-s", "%dx%d" % (width, height), "-r", str(self.fps), "-i", "-",
+                 "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", self.filename],
+                stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(rgb).tobytes())
+
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+# Advance the CA ticks time steps, and write the first frame and every
+# every-th time step after it.
+def render(ca, ticks, writer, every=1, scale=1):
+    writer.write(pixels(frame(ca), scale))
+    for tick in range(1, ticks + 1):
+        ca.evolve()
+        if tick % every == 0:
+            writer.write(pixels(frame(ca), scale))
+    writer.close()
+
+
+if __name__ == "__main__":
+    from food import engines
+
+    parser = argparse.ArgumentParser(description="Render the Ants CA to PNG images or a video.")
+    parser.add_argument('--preset')
+    parser.add_argument('--engine', choices=[e for e in engines if e != 'ensemble'], default='python')
+    parser.add_argument('--N', type=int, default=50)
+    parser.add_argument('--ants', type=int, default=100)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--every', type=int, default=1, help="render every k-th time step")
+    parser.add_argument('--scale', type=int, default=4, help="pixels per cell")
+    parser.add_argument('--out', default='frames', help="directory for the PNG images")
+    parser.add_argument('--video', help="write a video instead, e.g. ants.mp4")
+    parser.add_argument('--fps', type=int, default=30)
+    args = parser.parse_args()
+
+    if args.video and shutil.which("ffmpeg") is None:
+        print("Writing a video needs ffmpeg, use --out to write PNG images instead.")
+        exit(1)
+
+    # The counter is not used, so it only keeps its last row.
+    if args.preset:
+        ants = engines[args.engine](preset=args.preset, seed=args.seed, counter=dict(window=1))
+    else:
+        ants = engines[args.engine](N=args.N, ants_count=args.ants, seed=args.seed, counter=dict(window=1))
+
+    if args.video:
+        writer = VideoWriter(args.video, args.fps)
+    else:
+        writer = PNGWriter(args.out)
+
+    render(ants, args.ticks, writer, args.every, args.scale)
@@ -0,0 +1,182 @@
+"""
+Columnar storage for the results of food.py --experiment.
+The results are saved in a directory with one .npy file per array:
+runs.npy holds (sources, amount, replicate) for each run, offsets.npy where
+the time series of each run start, and food.npy and on_pher.npy the time
+series of all runs one after the other. reasons.npy holds why each run
+stopped, and is missing for results saved before runs recorded this.
+Results of a Sweep also hold the value of every parameter for each run,
+one .npy file per parameter in the params directory. iterations.npy holds
+the number of time steps of each run, for runs that only kept some rows of
+their time series, such as those of food.py --experiment3d.
+The arrays are memory-mapped when loaded, so only the parts that are used
+are read from disk.
+
+Convert the pickled results of earlier experiments with:
+python3 results.py ex1 ex1.cols
+"""
+
+import argparse
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+
+SERIES = ["food", "on_pher"]
+
+
+class Results():
+    def __init__(self, runs, offsets, series, reasons=None, params=None, iterations=None):
+        self.runs = runs
+        self.offsets = offsets
+        self.series = series
+        self.reasons = reasons
+        self.params = params or {}
+        self.iterations = iterations
+
+
+    # Build the results from the dictionary used by the pickled format,
+    # which maps (sources, amount) to a list of (food, on_pher) for each run.
+    # The stop reasons of the runs can be given in the same order.
+    @classmethod
+    def from_dict(cls, results, reasons=None):
+        runs = []
+        lengths = []
+        series = {name: [] for name in SERIES}
+
+        for ((sources, amount), values) in results.items():
+            for (replicate, value) in enumerate(values):
+                runs.append((sources, amount, replicate))
+                lengths.append(len(value[0]))
+                for (name, s) in zip(SERIES, value):
+                    series[name].append(np.asarray(s, dtype=np.int32))
+
+        runs = np.array(runs, dtype=np.int64).reshape(-1, 3)
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        series = {name: np.concatenate(s) if s else np.zeros(0, dtype=np.int32)
+                  for (name, s) in series.items()}
+        if reasons is not None:
+            reasons = np.array(reasons, dtype=str)
+        return cls(runs, offsets, series, reasons)
+
+
+    # Build the results of the (point, replicate) runs of a Sweep from their counters,
+    # with the parameters of the points and the fixed ones. Runs without food_sources
+    # or food_amount among their parameters have -1 in runs.
+    @classmethod
+    def from_runs(cls, runs, counters, reasons=None, fixed=None):
+        parameters = [dict(fixed or {}, **point) for (point, _) in runs]
+        keys = [(p.get("food_sources", -1), p.get("food_amount", -1), replicate)
+                for (p, (_, replicate)) in zip(parameters, runs)]
+        offsets = np.concatenate([[0], np.cumsum([len(counter) for counter in counters], dtype=np.int64)])
+        series = {name: np.concatenate([counter.column(i) for counter in counters]).astype(np.int32)
+                  if counters else np.zeros(0, dtype=np.int32) for (i, name) in enumerate(SERIES)}
+        params = {name: np.array([p[name] for p in parameters]) for name in (parameters[0] if parameters else [])}
+        iterations = np.array([counter.count for counter in counters], dtype=np.int64)
+        if reasons is not None:
+            reasons = np.array(reasons, dtype=str)
+        return cls(np.array(keys, dtype=np.int64).reshape(-1, 3), offsets, series, reasons, params, iterations)
+
+
+    # Memory-map the results saved in a directory.
+    @classmethod
+    def load(cls, path):
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        reasons = load("reasons") if os.path.exists(os.path.join(path, "reasons.npy")) else None
+        iterations = load("iterations") if os.path.exists(os.path.join(path, "iterations.npy")) else None
+        params = {}
+        if os.path.isdir(os.path.join(path, "params")):
+            params = {name[:-len(".npy")]: load(os.path.join("params", name[:-len(".npy")]))
+                      for name in sorted(os.listdir(os.path.join(path, "params")))}
+        return cls(load("runs"), load("offsets"), {name: load(name) for name in SERIES}, reasons, params,
+                   iterations)
+
+
+    # Save the results in a directory. The results saved there before are removed first,
+    # so none of their arrays are loaded together with these.
+    def save(self, path):
+        check_target(path)
+        os.makedirs(path, exist_ok=True)
+        for name in ["runs", "offsets", "reasons", "iterations"] + SERIES:
+            if os.path.exists(os.path.join(path, name + ".npy")):
+                os.remove(os.path.join(path, name + ".npy"))
+        shutil.rmtree(os.path.join(path, "params"), ignore_errors=True)
+        np.save(os.path.join(path, "runs.npy"), self.runs)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        for (name, s) in self.series.items():
+            np.save(os.path.join(path, name + ".npy"), s)
+        if self.reasons is not None:
+            np.save(os.path.join(path, "reasons.npy"), self.reasons)
+        if self.iterations is not None:
+            np.save(os.path.join(path, "iterations.npy"), self.iterations)
+        if self.params:
+            os.makedirs(os.path.join(path, "params"), exist_ok=True)
+            for (name, values) in self.params.items():
+                np.save(os.path.join(path, "params", name + ".npy"), values)
+
+
+    # The (sources, amount) pairs, in the order they were run.
+    def keys(self):
+        keys = []
+        for (sources, amount, _) in self.runs:
+            key = (int(sources), int(amount))
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+
+    # Indices of the runs of a (sources, amount) pair.
+    def runs_of(self, key):
+        (sources, amount) = key
+        return np.flatnonzero((self.runs[:, 0] == sources) & (self.runs[:, 1] == amount))
+
+
+    # Time series of one run, without copying it.
+    def get(self, name, run):
+        return self.series[name][self.offsets[run]:self.offsets[run + 1]]
+
+
+    # The values of a parameter of a Sweep, each with the indices of its runs,
+    # in the order they were run.
+    def groups(self, name):
+        values = self.params[name]
+        (_, first) = np.unique(values, return_index=True)
+        return [(values[i].item(), np.flatnonzero(values == values[i])) for i in sorted(first)]
+
+
+    # Number of iterations of every run, which only needs the offsets or iterations.
+    def run_lengths(self):
+        return self.iterations if self.iterations is not None else np.diff(self.offsets)
+
+
+    # Number of iterations of each run of a (sources, amount) pair.
+    def lengths(self, key):
+        return self.run_lengths()[self.runs_of(key)]
+
+
+# Check that results can be saved in path: a directory, or a path that does not exist yet.
+# Experiments only save their results once all runs have finished, so they check this first.
+def check_target(path):
+    if os.path.exists(path) and not os.path.isdir(path):
+        raise ValueError("Can not save results in " + path + ", it is a file. Use another path, e.g. " +
+                         path + ".cols")
+
+
+# Load results saved in a directory, or pickled by an earlier version of food.py.
+def load_results(path):
+    if os.path.isdir(path):
+        return Results.load(path)
+
+    with open(path, "rb") as f:
+        return Results.from_dict(pickle.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert pickled results to the columnar format.")
+    parser.add_argument('pickle')
+    parser.add_argument('directory')
+    args = parser.parse_args()
+
+    load_results(args.pickle).save(args.directory)